@@ -1,12 +1,14 @@
 import asyncio
+import re
 from typing import TYPE_CHECKING
 
 from cacherator import Cached, JSONCache
-from docorator import Docorator
 from logorator import Logger
 from slugify import slugify
 from toml_i18n import i18n
 
+import document_backend
+from sheet_writer import sheet_writer
 from topic import Topic
 
 if TYPE_CHECKING:
@@ -17,7 +19,24 @@ def _sanitize_markdown(markdown: str = ""):
     return markdown.replace("```", "").replace("markdown", "")
 
 
+def _digest(markdown: str, max_words: int) -> str:
+    # first sentence of every paragraph until the word limit is reached
+    sentences = []
+    words = 0
+    for paragraph in re.split(r"\n\s*\n", markdown):
+        paragraph = paragraph.strip()
+        if not paragraph or paragraph.startswith("#"):
+            continue
+        sentence = " ".join(re.split(r"(?<=[.!?])\s+", paragraph, maxsplit=1)[0].split()[:max_words - words])
+        sentences.append(sentence)
+        words += len(sentence.split())
+        if words >= max_words:
+            break
+    return " ".join(sentences)
+
+
 class ArticleWriter(JSONCache):
+    DIGEST_WORDS = 80
 
     def __init__(self, bg: "BookGenerator") -> None:
         self.book_generator = bg
@@ -30,12 +49,12 @@ class ArticleWriter(JSONCache):
         self._initialized = False
         self._topic_information = None
         self._full_article_draft = None
+        self._article_context = None
         self._sections = []
 
-        self.google_doc_final_article = Docorator(
-            service_account_file=self.book_generator.settings.service_account_file,
-            document_name=f"Article {slugify(self.book_generator.settings.author)} {slugify(self.book_generator.settings.title)}",
-            clear_cache=self.book_generator.clear_cache)
+        self.google_doc_final_article = document_backend.open_document(
+            self.book_generator,
+            document_name=f"Article {slugify(self.book_generator.settings.author)} {slugify(self.book_generator.settings.title)}")
 
     @property
     def topics_tab(self):
@@ -92,7 +111,7 @@ class ArticleWriter(JSONCache):
             row.append(topic.google_doc_refined_topic_text.url())
             row.append(await topic.refined_text_word_count())
             tab.data.append(row)
-        tab.write_data(overwrite_tab=True)
+        sheet_writer.write(tab, overwrite_tab=True)
 
     @Logger()
     async def write_all_drafts(self):
@@ -110,6 +129,18 @@ class ArticleWriter(JSONCache):
                 self._full_article_draft.append(row)
         return self._full_article_draft
 
+    async def article_context(self):
+        if self._article_context is None:
+            context = []
+            for topic in self.topics:
+                context.append({
+                    "order" : topic.order,
+                    "topic" : topic.name,
+                    "notes" : topic.details,
+                    "digest": _digest(await topic.draft(), self.DIGEST_WORDS)})
+            self._article_context = context
+        return self._article_context
+
     @Logger()
     async def refine_all_drafts(self):
         tasks = []
@@ -155,20 +186,29 @@ class ArticleWriter(JSONCache):
     @Logger()
     async def save_full_article_to_google_doc(self):
         await self._initialize_topic_content_docs()
-        await self.google_doc_final_article.initialize()
         markdown = ""
         sections = await self.sections()
         for section in sections:
             markdown += section["text"] + "\n\n"
+        await self.google_doc_final_article.initialize()
         await self.google_doc_final_article.update_from_markdown(markdown_text=_sanitize_markdown(markdown))
         self.book_generator.settings.set("Final Article", self.google_doc_final_article.url())
 
-    async def run(self):
+    @Logger()
+    async def update_document_links(self):
+        # mirrored documents are linked by their local path until they reach Google Docs; this waits for them once per run
+        documents = [document for topic in self.topics for document in (topic.google_doc_topic_draft, topic.google_doc_refined_topic_text)]
+        await asyncio.gather(*[document.sync() for document in documents + [self.google_doc_final_article]])
+        await self.save_topic_structure_to_google_doc()
+        self.book_generator.settings.set("Final Article", self.google_doc_final_article.url())
+
+    async def write_topics(self):
         await self._initialize_topic_content_docs()
         await self.save_topic_structure_to_google_doc()
         await self.write_all_drafts()
         await self.refine_all_drafts()
 
+    async def assemble(self):
         self._sections = await self._sections_from_topics()
 
         await self.add_key_facts_section()
@@ -179,3 +219,8 @@ class ArticleWriter(JSONCache):
         await self.sort_sections()
 
         await self.save_full_article_to_google_doc()
+        await self.update_document_links()
+
+    async def run(self):
+        await self.write_topics()
+        await self.assemble()
@@ -1,21 +1,37 @@
 import asyncio
+import threading
 from pathlib import Path
 
 from cacherator import Cached, JSONCache
+from logorator import Logger
 from slugify import slugify
 from smart_spread import SmartSpread
 from toml_i18n import TomlI18n
 from book_worker import BookWorker
 import traceback
 import _config as config
+from lease_store import LeaseStore
+from sheet_writer import sheet_writer
 
 
 class AsinListWorker(JSONCache):
+    DEFAULT_BOOKS_IN_FLIGHT = 3
 
-    def __init__(self, sheet_identifier=""):
+    def __init__(self,
+                 sheet_identifier="",
+                 books_in_flight: int = DEFAULT_BOOKS_IN_FLIGHT,
+                 lease_directory: str = LeaseStore.DEFAULT_DIRECTORY,
+                 lease_duration: int = LeaseStore.DEFAULT_LEASE_DURATION):
         self.sheet_identifier = sheet_identifier
         self.service_account_key = config.SERVICE_ACCOUNT_KEY
         super().__init__(data_id=f"{self.sheet_identifier}", directory="data/asin_list_worker")
+        self.books_in_flight = books_in_flight
+        self.lease_store = LeaseStore(name=self.sheet_identifier, directory=lease_directory, lease_duration=lease_duration)
+        self._data_tab = None
+        self._pending_updates: dict[str, dict] = {}
+        self._applied_updates: dict[str, dict] = {}
+        self._pending_updates_lock = threading.Lock()
+        self._excluded_cache_vars = ["service_account_key", "lease_store", "_data_tab", "_pending_updates", "_applied_updates", "_pending_updates_lock"]
 
     @property
     @Cached()
@@ -23,13 +39,51 @@ class AsinListWorker(JSONCache):
         return SmartSpread(sheet_identifier=self.sheet_identifier, service_account_data=self.service_account_key)
 
     @property
-    @Cached()
     def data_tab(self):
-        return self.sheet.tab(tab_name="ASINs", data_format="dict")
+        if self._data_tab is None:
+            self._data_tab = self.sheet.tab(tab_name="ASINs", data_format="dict")
+        return self._data_tab
+
+    def _reload_data_tab(self):
+        # other workers may have written rows since our last read, so never write back a stale copy of the tab
+        sheet = SmartSpread(sheet_identifier=self.sheet_identifier, service_account_data=self.service_account_key, clear_cache=True)
+        self._data_tab = sheet.tab(tab_name="ASINs", data_format="dict")
+        return self._data_tab
 
     def open_asins(self):
         return [row for row in self.data_tab.data if row.get("Done", None) == 0]
 
+    def _is_still_open(self, asin) -> bool:
+        # rows are listed once per run; another worker may have finished this one since
+        rows = [row for row in self._reload_data_tab().data if row.get("ASIN") == asin]
+        return bool(rows) and rows[0].get("Done", None) == 0
+
+    def _data_tab_with_pending_updates(self):
+        self._reload_data_tab()
+        sheet_writer.track(self.data_tab, key=self._data_tab_key)
+        # updates stay queued until the write succeeds, so a retried flush applies them again
+        with self._pending_updates_lock:
+            self._applied_updates = {asin: dict(row) for asin, row in self._pending_updates.items()}
+        for asin, row in self._applied_updates.items():
+            self.data_tab.update_row_by_column_pattern(column="ASIN", value=asin, updates=row)
+        return self.data_tab
+
+    def _drop_written_updates(self):
+        with self._pending_updates_lock:
+            for asin, row in self._applied_updates.items():
+                if self._pending_updates.get(asin) == row:
+                    del self._pending_updates[asin]
+            self._applied_updates = {}
+
+    @property
+    def _data_tab_key(self):
+        return f"{self.sheet_identifier}/ASINs"
+
+    async def _update_row(self, asin, row):
+        with self._pending_updates_lock:
+            self._pending_updates.setdefault(asin, {}).update(row)
+        sheet_writer.write(self.data_tab, key=self._data_tab_key, prepare=self._data_tab_with_pending_updates, on_written=self._drop_written_updates)
+
     async def run_row(self, row):
         asin = row.get("ASIN")
         bw = BookWorker(asin=asin, language=row.get("Language", None), country=row.get("Country", None))
@@ -37,32 +91,82 @@ class AsinListWorker(JSONCache):
         row["Author"] = await bw.author()
         row["Title"] = await bw.title()
         row["Settings"] = await bw.settings_url()
-        self.data_tab.update_row_by_column_pattern(column="ASIN", value=asin, updates=row)
-        self.data_tab.write_data()
+        await self._update_row(asin, row)
         await bw.run()
         row["Text"] = await bw.final_text_url()
         row["Done"] = 1
-        self.data_tab.update_row_by_column_pattern(column="ASIN", value=asin, updates=row)
-        self.data_tab.write_data()
+        await self._update_row(asin, row)
+
+    async def _run_row_and_record_errors(self, row):
+        try:
+            await self.run_row(row)
+        except Exception as e:
+            error = f"{str(e)} \n\n {traceback.format_exc()}"
+
+            row["Exception"] = error
+            row["Done"] = -1
+            await self._update_row(row.get("ASIN"), row)
+
+    async def _keep_lease_alive(self, asin, row_task: asyncio.Task):
+        while True:
+            await asyncio.sleep(self.lease_store.lease_duration / 3)
+            if not await asyncio.to_thread(self.lease_store.heartbeat, asin):
+                Logger.note(f"Lost lease on ASIN {asin} to another worker, stopping the row")
+                row_task.cancel()
+                return
+
+    async def _run_claimed_row(self, row) -> bool:
+        asin = row.get("ASIN")
+        if not await asyncio.to_thread(self.lease_store.claim, asin):
+            return False
+        if not await asyncio.to_thread(self._is_still_open, asin):
+            Logger.note(f"ASIN {asin} was finished by another worker, skipping it")
+            await asyncio.to_thread(self.lease_store.release, asin)
+            return False
+        row_task = asyncio.create_task(self._run_row_and_record_errors(row))
+        heartbeat = asyncio.create_task(self._keep_lease_alive(asin, row_task))
+        completed = False
+        try:
+            await row_task
+            completed = True
+        except asyncio.CancelledError:
+            lease_lost = heartbeat.done() and not heartbeat.cancelled()
+            if not lease_lost:
+                raise
+        finally:
+            heartbeat.cancel()
+            await asyncio.to_thread(self.lease_store.release, asin, completed=completed)
+        return True
 
     async def run(self):
-        open_asin_rows = self.open_asins()
-        for row in open_asin_rows[:1]:
-            try:
-                await self.run_row(row)
-            except Exception as e:
-                error = f"{str(e)} \n\n {traceback.format_exc()}"
+        for row in self.open_asins():
+            if await self._run_claimed_row(row):
+                break
+        await sheet_writer.flush()
+
+    @Logger()
+    async def run_batch(self, books_in_flight: int | None = None):
+        # TomlI18n holds a single process-wide locale, so only books of the same language run side by side
+        rows_by_language = {}
+        for row in self.open_asins():
+            rows_by_language.setdefault(row.get("Language", None), []).append(row)
+
+        semaphore = asyncio.Semaphore(books_in_flight or self.books_in_flight)
+
+        async def sem_task(row):
+            async with semaphore:
+                return await self._run_claimed_row(row)
 
-                row["Exception"] = error
-                row["Done"] = -1
-                self.data_tab.update_row_by_column_pattern(column="ASIN", value=row.get("ASIN"), updates=row)
-                self.data_tab.write_data()
+        for language, rows in rows_by_language.items():
+            Logger.note(f"Processing {len(rows)} open ASINs for language '{language}'")
+            await asyncio.gather(*[sem_task(row) for row in rows])
+        await sheet_writer.flush()
 
 
 async def main():
     en = AsinListWorker(sheet_identifier="1m41zxMXB9KZSNkkZq01hXqudmqrlwttgneh-uy-d4yU")
     de = AsinListWorker(sheet_identifier="1zoeh2JvUvak45yvXz_jqGafKHCAlosMCphFiYpJUqYQ")
-    await de.run()
+    await de.run_batch()
     #tab = alw.sheet.tab(tab_name="ASINs", data_format="dict")
     #print(alw.open_asins())
 
@@ -6,13 +6,14 @@ import yaml
 from cacherator import JSONCache
 from logorator import Logger
 from slugify import slugify
-from smartllm import AsyncLLM
 from toml_i18n import i18n
 
 import audible_page
 from audible_feature_image import AudibleImage, create_audible_feature_image_tuple, save_image
-from audible_page import AudiblePage
+from audible_matcher import AudibleMatcher
+from audible_page import AudibleProduct
 from audible_search import AudibleSearch
+from llm_runner import execute_llm
 
 if TYPE_CHECKING:
     from book_generator import BookGenerator
@@ -22,11 +23,11 @@ class AudibleFinder(JSONCache):
     DEFAULT_IMAGE_DIRECTORY = "data/images/webp"
 
     def __init__(self, bg: "BookGenerator") -> None:
-        self.product_pages: [AudiblePage] = []
         self.book_generator = bg
         self.sheet_identifier = self.book_generator.sheet_identifier
         data_id = f"{slugify(self.sheet_identifier)}"
         self._content = ""
+        self._product_matches: dict[str, bool] = {}
         super().__init__(data_id=data_id,
                          directory="data/audible_finder",
                          ttl=self.book_generator.ttl,
@@ -35,6 +36,8 @@ class AudibleFinder(JSONCache):
         self._audible_pages = []
         self._book_descriptions = []
         self._on_audible_section = ""
+        self.products: list[AudibleProduct] = []
+        self._excluded_cache_vars = ["_audible_pages", "products"]
 
     @Logger()
     async def _find_audible_urls(self) -> List[str]:
@@ -54,23 +57,23 @@ class AudibleFinder(JSONCache):
         return self._audible_pages
 
     @Logger()
-    async def _analyse_all_pages(self):
-        semaphore = asyncio.Semaphore(40)
+    async def _load_all_pages(self):
+        await asyncio.gather(*[page.record() for page in await self.audible_pages()])
 
-        async def sem_task(page):
-            async with semaphore:
-                return await page.run_analysis()
-
-        tasks = [sem_task(s) for s in await self.audible_pages()]
-        await asyncio.gather(*tasks)
+    @Logger()
+    async def _reduce_pages_to_products(self) -> list[AudibleProduct]:
+        # the pages hold parsed documents and scrapers; only the extracted records are needed from here on
+        products = [await page.product() for page in await self.audible_pages()]
+        self._audible_pages = []
+        return products
 
     @Logger()
     async def _generate_descriptions_with_llm(self):
         with open(str(Path(__file__).parent / "i18n/audible_finder.summarize_products.yaml"), "r") as f:
             json_schema = yaml.safe_load(f)
 
-        pages = self.product_pages[:self.book_generator.settings.max_audiobooks]
-        information = [await p.information() for p in pages]
+        products = self.products[:self.book_generator.settings.max_audiobooks]
+        information = [p.information() for p in products]
         article = await self.book_generator.article_writer.sections()
         prompt = i18n(
             "audible_finder.summarize_products",
@@ -79,7 +82,8 @@ class AudibleFinder(JSONCache):
             products=information,
             article=article)
 
-        llm = AsyncLLM(
+        response = await execute_llm(
+            stage="audible_finder.summarize_products",
             base=self.book_generator.settings.general_base,
             model=self.book_generator.settings.general_model,
             api_key=self.book_generator.settings.general_api_key,
@@ -89,31 +93,19 @@ class AudibleFinder(JSONCache):
             max_output_tokens=50_000,
             json_mode=True,
             json_schema=json_schema)
-        await llm.execute()
-        result = llm.response.get("audible_products")
+        result = response.get("audible_products")
         return result
 
-    async def _sort_product_pages(self, pages=None):
-        result = pages
-        for page in result:
-            page.sort = await page.num_ratings()
-        result = sorted(result, key=lambda p: p.sort, reverse=True)
-        return result
-
-    async def _remove_duplicate_pages(self, pages=None):
-        async def pages_are_equal(page1: AudiblePage, page2: AudiblePage):
-            if await page1.title() != await page2.title(): return False
-            if await page1.author() != await page2.author(): return False
-            if await page1.narrators() != await page2.narrators(): return False
-            if await page1.is_abridged() != await page2.is_abridged(): return False
-            return True
-
+    @staticmethod
+    def _sort_and_remove_duplicates(products: list[AudibleProduct], fuzzy: bool = False) -> list[AudibleProduct]:
+        # the most rated product of each identity is kept
         result = []
-        for page in pages:
-            is_duplicate = False
-            for listed_page in result:
-                if await pages_are_equal(listed_page, page): is_duplicate = True
-            if not is_duplicate: result.append(page)
+        seen = set()
+        for product in sorted(products, key=lambda p: p.num_ratings, reverse=True):
+            key = product.identity_key(fuzzy=fuzzy)
+            if key not in seen:
+                seen.add(key)
+                result.append(product)
         return result
 
     async def book_descriptions(self):
@@ -124,21 +116,21 @@ class AudibleFinder(JSONCache):
     async def generate_on_audible_section(self):
         result = f"## {i18n("general.on_audible", title=self.book_generator.settings.title)}\n\n"
         for description in await self.book_descriptions():
-            product_page: AudiblePage | None = None
-            for page in self.product_pages:
-                if description.get("asin", "") == await page.asin():
-                    product_page = page
+            product: AudibleProduct | None = None
+            for candidate in self.products:
+                if description.get("asin", "") == candidate.asin:
+                    product = candidate
                     break
-            if product_page is None:
+            if product is None:
                 break
             result += f"**{description.get("asin")}**\n\n"
-            abridged = f"({i18n('general.abridged_version')})" if (await product_page.is_abridged()) else ""
-            result += f"- **[{await product_page.title()}]({product_page.url})** {abridged}\n"
+            abridged = f"({i18n('general.abridged_version')})" if product.is_abridged else ""
+            result += f"- **[{product.title}]({product.url})** {abridged}\n"
 
-            result += f"""- **{i18n('general.language')}**: {i18n(f"general.{await product_page.language()}")}\n"""
-            result += f"- **{i18n('general.narrator')}**: {", ".join(await product_page.narrators())}\n"
-            result += f"- **{i18n('general.duration')}**: {await product_page.say_duration()}\n"
-            result += f"- **{i18n('general.rating')}**: {await product_page.say_rating()}\n"
+            result += f"""- **{i18n('general.language')}**: {i18n(f"general.{product.language}")}\n"""
+            result += f"- **{i18n('general.narrator')}**: {", ".join(product.narrators)}\n"
+            result += f"- **{i18n('general.duration')}**: {product.say_duration()}\n"
+            result += f"- **{i18n('general.rating')}**: {product.say_rating()}\n"
             result += f"\n\n{description.get("description", "")}\n\n"
         return result
 
@@ -151,8 +143,8 @@ class AudibleFinder(JSONCache):
     async def save_feature_image(self):
         file_name = slugify(f"{self.book_generator.settings.author}-{self.book_generator.settings.title}")[:100]
         urls = []
-        for page in self.product_pages[:5]:
-            urls.append(await page.image_url())
+        for product in self.products[:5]:
+            urls.append(product.image_url)
 
         if len(urls) < 5: urls = urls[:3]
         for i in range(len(urls)):
@@ -163,9 +155,11 @@ class AudibleFinder(JSONCache):
 
     @Logger()
     async def run(self):
-        await self._analyse_all_pages()
-        correct_pages = [page for page in (await self.audible_pages()) if (await page.is_correct_page_for_book())]
-        sorted_pages = await self._sort_product_pages(correct_pages)
-        self.product_pages = await self._remove_duplicate_pages(sorted_pages)
+        await self._load_all_pages()
+        products = await self._reduce_pages_to_products()
+        self._product_matches = await AudibleMatcher(self.book_generator).match(products, known=self._product_matches)
+        correct_products = [product for product in products if product.is_correct]
+        fuzzy = self.book_generator.settings.audible_duplicate_matching == "fuzzy"
+        self.products = self._sort_and_remove_duplicates(correct_products, fuzzy=fuzzy)
         self._on_audible_section = await self.generate_on_audible_section()
         await self.save_feature_image()
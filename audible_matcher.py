@@ -0,0 +1,131 @@
+from difflib import SequenceMatcher
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import yaml
+from logorator import Logger
+from toml_i18n import i18n
+
+import token_budget
+from audible_page import AudibleProduct
+from helper import normalise_text
+from llm_runner import execute_llm
+
+if TYPE_CHECKING:
+    from book_generator import BookGenerator
+
+ACCEPT = "accept"
+REJECT = "reject"
+UNSURE = "unsure"
+
+
+def title_similarity(book_title: str | None, product_title: str | None) -> float:
+    book_title, product_title = normalise_text(book_title, fuzzy=True), normalise_text(product_title, fuzzy=True)
+    if not book_title or not product_title:
+        return 0.0
+    if book_title == product_title:
+        return 1.0
+    return SequenceMatcher(None, book_title, product_title).ratio()
+
+
+def authors_match(book_author: str | None, product_authors: list[str] | None) -> bool:
+    book_author = normalise_text(book_author, fuzzy=True)
+    if not book_author:
+        return False
+    surname = book_author.split()[-1]
+    for author in product_authors or []:
+        author = normalise_text(author, fuzzy=True)
+        if author and (author.split()[-1] == surname or SequenceMatcher(None, book_author, author).ratio() >= 0.85):
+            return True
+    return False
+
+
+class AudibleMatcher:
+    ACCEPT_TITLE_SIMILARITY = 0.9
+    REJECT_TITLE_SIMILARITY = 0.4
+
+    def __init__(self, bg: "BookGenerator"):
+        self.book_generator = bg
+
+    def __str__(self):
+        return f"AudibleMatcher ({self.book_generator.settings.title})"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def prefilter(self, product: AudibleProduct) -> str:
+        settings = self.book_generator.settings
+        if product.language not in settings.audiobook_languages:
+            return REJECT
+        if settings.asin and product.asin == settings.asin:
+            return ACCEPT
+        similarity = title_similarity(settings.title, product.title)
+        same_author = authors_match(settings.author, product.authors)
+        if similarity >= self.ACCEPT_TITLE_SIMILARITY and same_author:
+            return ACCEPT
+        if similarity < self.REJECT_TITLE_SIMILARITY and not same_author:
+            return REJECT
+        return UNSURE
+
+    @staticmethod
+    def _candidate(product: AudibleProduct) -> dict:
+        return {
+            "asin"       : product.asin,
+            "title"      : product.title,
+            "authors"    : product.authors,
+            "narrators"  : product.narrators,
+            "language"   : product.language,
+            "is_abridged": product.is_abridged,
+            "summary"    : product.summary or ""}
+
+    @Logger()
+    async def classify(self, products: list[AudibleProduct]) -> dict[str, bool]:
+        if not products:
+            return {}
+        with open(str(Path(__file__).parent / "i18n/audible_matcher.classify.yaml"), "r") as f:
+            json_schema = yaml.safe_load(f)
+
+        def build_prompt(candidates):
+            return i18n(
+                "audible_matcher.classify",
+                title=self.book_generator.settings.title,
+                author=self.book_generator.settings.author,
+                candidates=candidates)
+
+        candidates = [self._candidate(product) for product in products]
+        prompt = build_prompt(token_budget.fit_items(candidates, token_budget.remaining_tokens(build_prompt([])), text_key="summary"))
+        response = await execute_llm(
+            stage="audible_matcher.classify",
+            base=self.book_generator.settings.general_base,
+            model=self.book_generator.settings.general_model,
+            api_key=self.book_generator.settings.general_api_key,
+            prompt=prompt,
+            temperature=0.2,
+            max_input_tokens=200_000,
+            max_output_tokens=50_000,
+            json_mode=True,
+            json_schema=json_schema)
+        return {item.get("asin"): bool(item.get("is_correct_product")) for item in (response or {}).get("audible_products", [])}
+
+    @Logger()
+    async def match(self, products: list[AudibleProduct], known: dict[str, bool] | None = None) -> dict[str, bool]:
+        # returns asin -> is_correct for all products; known verdicts from earlier runs are reused
+        known = known or {}
+        result = {}
+        unsure = []
+        for product in products:
+            if product.asin in known:
+                result[product.asin] = known[product.asin]
+                continue
+            verdict = self.prefilter(product)
+            if verdict == UNSURE:
+                unsure.append(product)
+            else:
+                result[product.asin] = verdict == ACCEPT
+        Logger.note(f"{self}: {len(result)} settled locally, {len(unsure)} sent to the LLM")
+        classified = await self.classify(unsure)
+        for product in unsure:
+            result[product.asin] = classified.get(product.asin, False)
+        for product in products:
+            product.is_correct = result[product.asin]
+        return result
@@ -1,23 +1,85 @@
 import json
 import re
+from dataclasses import dataclass, field
 from html import unescape
 from pathlib import Path
 from typing import TYPE_CHECKING
 
 import yaml
 from bs4 import BeautifulSoup
-from cacherator import JSONCache
+from cacherator import Cached, JSONCache
 from ghostscraper import GhostScraper
 from logorator import Logger
 from slugify import slugify
-from smartllm import AsyncLLM
 from toml_i18n import i18n, i18n_number, TomlI18n
 
+import concurrency
+import html_parser
+from helper import normalise_text, to_float, to_int
+from llm_runner import execute_llm
+from page_store import page_store
+
 if TYPE_CHECKING:
     from book_generator import BookGenerator
 
 
+@dataclass(slots=True)
+class AudibleProduct:
+    url: str
+    asin: str
+    title: str | None = None
+    authors: list[str] | None = None
+    narrators: list[str] = field(default_factory=list)
+    summary: str | None = None
+    duration: int = 0
+    language: str | None = None
+    is_abridged: bool | None = None
+    num_ratings: int = 0
+    average_rating: float = 0
+    image_url: str | None = None
+    reviews: list[dict] | None = None
+    is_correct: bool = False
+
+    @property
+    def author(self):
+        return self.authors[0] if self.authors else None
+
+    def identity_key(self, fuzzy: bool = False) -> tuple:
+        return (normalise_text(self.title, fuzzy),
+                normalise_text(self.author, fuzzy),
+                tuple(sorted(normalise_text(narrator, fuzzy) for narrator in self.narrators)),
+                bool(self.is_abridged))
+
+    def say_duration(self) -> str:
+        (hours, minutes) = divmod(self.duration, 60)
+        return f"""{"0" if hours < 10 else ""}{hours}:{"0" if minutes < 10 else ""}{minutes}"""
+
+    def say_rating(self) -> str:
+        if self.average_rating == 0:
+            return "-"
+        return f"{i18n_number(self.average_rating, decimals=1)} / 5"
+
+    def information(self) -> dict:
+        return {
+            "asin"       : self.asin,
+            "title"      : self.title,
+            "is_abridged": self.is_abridged,
+            "authors"    : self.authors,
+            "narrators"  : self.narrators,
+            "summary"    : self.summary,
+            "duration"   : self.duration,
+            "rating"     : self.average_rating,
+            "language"   : self.language,
+            "reviews"    : self.reviews}
+
+
 class AudiblePage(JSONCache):
+    RECORD_VERSION = 1
+    PARSE_TARGETS = [
+        html_parser.Target("script"),
+        html_parser.Target("h1"),
+        html_parser.Target("adbl-text-block", slot="summary"),
+        html_parser.Target("div", class_="bc-tab-content")]
 
     def __init__(self, bg: "None|BookGenerator", url="", clear_cache: bool = False, ttl: bool = 7):
         self.book_generator = bg
@@ -30,17 +92,17 @@ class AudiblePage(JSONCache):
             ttl = self.book_generator.ttl
             load_timeout = self.book_generator.settings.audible_scrape_timeout
             max_retries = self.book_generator.settings.audible_scrape_retries
+        self._record: dict | None = None
         super().__init__(
             data_id=data_id, directory="data/audible_pages", clear_cache=clear_cache, ttl=ttl)
         self._is_correct_page_for_book = None
+        self._ttl = ttl
+        self._clear_cache = clear_cache
         self.url = url
-        self.scraper = GhostScraper(
-            url=self.url_with_country_override(),
-            clear_cache=clear_cache,
-            ttl=ttl,
-            load_timeout=load_timeout,
-            max_retries=max_retries)
+        self._load_timeout = load_timeout
+        self._max_retries = max_retries
         self._soup: None | BeautifulSoup = None
+        self._excluded_cache_vars = ["_soup"]
 
     def __str__(self):
         return f"Source {self.url}"
@@ -53,10 +115,26 @@ class AudiblePage(JSONCache):
         result = re.sub(r'(\?.*)?$', lambda m: ('&' if m.group(1) else '?') + params, self.url)
         return result
 
-    async def _get_soup_from_scrape(self):
-        html = await self.scraper.html()
+    @property
+    @Cached()
+    def scraper(self):
+        return GhostScraper(
+            url=self.url_with_country_override(),
+            clear_cache=self._clear_cache,
+            ttl=self._ttl,
+            load_timeout=self._load_timeout,
+            max_retries=self._max_retries)
+
+    async def _scrape_html(self):
+        async with concurrency.pool("scraping"):
+            html = await self.scraper.html()
         self.scraper.json_cache_save()
-        self._soup = BeautifulSoup(html, "html.parser")
+        return html
+
+    async def _get_soup_from_scrape(self):
+        html = await page_store.fetch(
+            self.url_with_country_override(), kind="html", scrape=self._scrape_html, ttl=self._ttl, refresh=self._clear_cache)
+        self._soup = html_parser.parse(html, targets=self.PARSE_TARGETS)
         return self._soup
 
     async def soup(self):
@@ -65,16 +143,12 @@ class AudiblePage(JSONCache):
         return self._soup
 
     async def run_analysis(self):
-        if self._soup is None:
-            self._soup = await self._get_soup_from_scrape()
+        await self.record()
         if self._is_correct_page_for_book is None:
             self._is_correct_page_for_book = (await self.analyse()).get("is_correct_product", False)
 
-    async def asin(self):
-        return re.search(r'/([A-Z0-9]{10})(?:[/?]|$)', self.url).group(1)
-
-    async def ld_json(self):
-        soup = await self.soup()
+    @staticmethod
+    def _ld_json(soup: BeautifulSoup) -> list:
         result = [json.loads(d.string, strict=False) for d in
                   soup.find_all(lambda tag: tag.name == 'script' and tag.get('type') in ['application/json',
                                                                                          'application/ld+json'])]
@@ -83,58 +157,18 @@ class AudiblePage(JSONCache):
             irregular_list) is list else [irregular_list]
         return flatten_list(result)
 
-    async def ld_json_type(self, type_=""):
-        for data in await self.ld_json():
-            if data.get("@type") and data["@type"] == type_:
-                return data
+    @staticmethod
+    def _audiobook_ld_json(ld_json: list) -> dict | None:
+        for type_ in ("PodcastSeries", "Audiobook", "BookSeries"):
+            for data in ld_json:
+                if data.get("@type") and data["@type"] == type_:
+                    return data
+        return None
 
-    async def audiobook_ld_json(self):
-        result = await self.ld_json_type(type_="PodcastSeries")
-        if result: return result
-        result = await self.ld_json_type(type_="Audiobook")
-        if result: return result
-        result = await self.ld_json_type(type_="BookSeries")
-        if result: return result
-
-    async def title(self):
-        soup = await self.soup()
-        h1 = soup.find("h1")
-        if h1 is None:
-            return None
-        return h1.get_text()
-
-    async def authors(self) -> []:
-        json = await self.audiobook_ld_json()
-        if json is None: return None
-        author_list = json.get("author")
-        result = [unescape(a["name"]) for a in author_list if "name" in a]
-        return result
-
-    async def author(self):
-        return (await self.authors())[0]
-
-    async def narrators(self) -> []:
-        json = await self.audiobook_ld_json()
-        if json is None: return []
-        author_list = json.get("readBy")
-        result = [unescape(a["name"]) for a in author_list if "name" in a]
-        return result
-
-    async def narrator(self):
-        return (await self.narrators())[0]
-
-    async def summary(self):
-        soup = await self.soup()
-        block = soup.find("adbl-text-block", {"slot": "summary"})
-        if block is None:
-            return None
-        return block.get_text()
-
-    async def duration(self) -> int:
-        json = await self.audiobook_ld_json()
-        if json is None: return 0
+    @staticmethod
+    def _duration(audiobook: dict) -> int:
         result = 0
-        dur = json.get("duration", "")
+        dur = str(audiobook.get("duration") or "")
         hours = re.findall(r"(\d+)H", dur)
         if len(hours) > 0:
             result += int(hours[0]) * 60
@@ -143,52 +177,24 @@ class AudiblePage(JSONCache):
             result += int(minutes[0])
         return result
 
-    async def say_duration(self) -> str:
-        (hours, minutes) = divmod(await self.duration(), 60)
-        return f"""{"0" if hours < 10 else ""}{hours}:{"0" if minutes < 10 else ""}{minutes}"""
-
-    async def language(self):
-        json = await self.audiobook_ld_json()
-        if json is None:
-            return None
-        return unescape(json.get("inLanguage"))
+    @staticmethod
+    def _num_ratings(audiobook: dict) -> int:
+        return to_int((audiobook.get("aggregateRating") or {}).get("ratingCount"))
 
-    async def is_abridged(self):
-        json = await self.audiobook_ld_json()
-        if json is None:
-            return None
-        return unescape(json.get("abridged", "false")) == "true"
+    @staticmethod
+    def _average_rating(audiobook: dict) -> float:
+        return to_float((audiobook.get("aggregateRating") or {}).get("ratingValue"))
 
-    async def num_ratings(self):
-        json = await self.audiobook_ld_json()
-        if json is None:
-            return 0
-        if "aggregateRating" in json:
-            rating = json["aggregateRating"]
-            result = rating["ratingCount"]
-            return int(result)
-        return 0
-
-    async def average_rating(self) -> float:
-        json = await self.audiobook_ld_json()
-        if json is None:
-            return 0
-        if await self.num_ratings() == 0:
-            return 0
-        if "aggregateRating" in json:
-            rating = json["aggregateRating"]
-            result = rating["ratingValue"]
-            return float(result)
-        return 0
+    @staticmethod
+    def _names(people) -> list[str]:
+        # ld+json allows a single person object as well as a list of them
+        if isinstance(people, dict):
+            people = [people]
+        return [unescape(p["name"]) for p in people or [] if isinstance(p, dict) and p.get("name")]
 
-    async def say_rating(self):
-        if (await self.average_rating()) == 0:
-            return "-"
-        return f"{i18n_number(await self.average_rating(), decimals=1)} / 5"
-
-    async def reviews(self):
+    @staticmethod
+    def _reviews(soup: BeautifulSoup):
         result = []
-        soup = await self.soup()
         bc_tab_content = soup.find("div", {"class": "bc-tab-content"})
         if bc_tab_content is None: return []
         review_section = bc_tab_content.find("div", {"class": "bc-section"})
@@ -222,7 +228,10 @@ class AudiblePage(JSONCache):
                         " people found this helpful", "").replace(" person found this helpful", ""))
             except:
                 review["likes"] = 0
-            review["rating"] = int(card.select("span[class~='bc-pub-offscreen']")[0].text.replace("out of 5 stars", ""))
+            try:
+                review["rating"] = int(card.select("span[class~='bc-pub-offscreen']")[0].text.replace("out of 5 stars", ""))
+            except (IndexError, ValueError):
+                continue
 
             if "Amazon Customer" in review["name_of_reviewer"]:
                 continue
@@ -230,11 +239,104 @@ class AudiblePage(JSONCache):
             result.append(review)
         return result
 
+    def _extract_record(self, soup: BeautifulSoup) -> dict:
+        audiobook = self._audiobook_ld_json(self._ld_json(soup))
+        h1 = soup.find("h1")
+        summary = soup.find("adbl-text-block", {"slot": "summary"})
+        record = {
+            "version"       : self.RECORD_VERSION,
+            "title"         : h1.get_text() if h1 is not None else None,
+            "summary"       : summary.get_text() if summary is not None else None,
+            "reviews"       : self._reviews(soup),
+            "has_ld_json"   : audiobook is not None,
+            "authors"       : None,
+            "narrators"     : [],
+            "duration"      : 0,
+            "language"      : None,
+            "is_abridged"   : None,
+            "num_ratings"   : 0,
+            "average_rating": 0,
+            "image_url"     : None}
+        if audiobook is not None:
+            # a malformed product page should yield an incomplete record, not fail the whole audible stage
+            num_ratings = self._num_ratings(audiobook)
+            language = audiobook.get("inLanguage")
+            image = audiobook.get("image")
+            record.update({
+                "authors"       : self._names(audiobook.get("author")),
+                "narrators"     : self._names(audiobook.get("readBy")),
+                "duration"      : self._duration(audiobook),
+                "language"      : unescape(language) if isinstance(language, str) else None,
+                "is_abridged"   : str(audiobook.get("abridged", "false")).lower() == "true",
+                "num_ratings"   : num_ratings,
+                "average_rating": self._average_rating(audiobook) if num_ratings else 0,
+                "image_url"     : unescape(image) if isinstance(image, str) else None})
+        return record
+
+    async def record(self) -> dict:
+        if self._record is None or self._record.get("version") != self.RECORD_VERSION:
+            soup = await self._get_soup_from_scrape()
+            self._record = self._extract_record(soup)
+            self._soup = None  # everything needed later is in the record
+            self.json_cache_save()
+        return self._record
+
+    async def asin(self):
+        return re.search(r'/([A-Z0-9]{10})(?:[/?]|$)', self.url).group(1)
+
+    async def ld_json(self):
+        return self._ld_json(await self.soup())
+
+    async def audiobook_ld_json(self):
+        return self._audiobook_ld_json(await self.ld_json())
+
+    async def title(self):
+        return (await self.record())["title"]
+
+    async def authors(self) -> []:
+        return (await self.record())["authors"]
+
+    async def author(self):
+        return (await self.authors())[0]
+
+    async def narrators(self) -> []:
+        return (await self.record())["narrators"]
+
+    async def narrator(self):
+        return (await self.narrators())[0]
+
+    async def summary(self):
+        return (await self.record())["summary"]
+
+    async def duration(self) -> int:
+        return (await self.record())["duration"]
+
+    async def say_duration(self) -> str:
+        (hours, minutes) = divmod(await self.duration(), 60)
+        return f"""{"0" if hours < 10 else ""}{hours}:{"0" if minutes < 10 else ""}{minutes}"""
+
+    async def language(self):
+        return (await self.record())["language"]
+
+    async def is_abridged(self):
+        return (await self.record())["is_abridged"]
+
+    async def num_ratings(self):
+        return (await self.record())["num_ratings"]
+
+    async def average_rating(self) -> float:
+        return (await self.record())["average_rating"]
+
+    async def say_rating(self):
+        if (await self.average_rating()) == 0:
+            return "-"
+        return f"{i18n_number(await self.average_rating(), decimals=1)} / 5"
+
+    async def reviews(self):
+        return (await self.record())["reviews"]
+
     async def image_url(self):
-        json = await self.audiobook_ld_json()
-        if json is None:
-            return None
-        return unescape(json.get("image", None))
+        return (await self.record())["image_url"]
 
     async def information(self):
         result = {
@@ -266,7 +368,8 @@ class AudiblePage(JSONCache):
             information=await self.information(),
             language=i18n("prompts.language"), )
 
-        llm = AsyncLLM(
+        response = await execute_llm(
+            stage="audible_page.analyse",
             base=self.book_generator.settings.general_base,
             model=self.book_generator.settings.general_model,
             api_key=self.book_generator.settings.general_api_key,
@@ -276,11 +379,27 @@ class AudiblePage(JSONCache):
             max_output_tokens=50_000,
             json_mode=True,
             json_schema=json_schema)
-        await llm.execute()
 
-        result = llm.response
+        result = response
         return result
 
+    async def product(self) -> AudibleProduct:
+        record = await self.record()
+        return AudibleProduct(
+            url=self.url,
+            asin=await self.asin(),
+            title=record["title"],
+            authors=record["authors"],
+            narrators=record["narrators"],
+            summary=record["summary"],
+            duration=record["duration"],
+            language=record["language"],
+            is_abridged=record["is_abridged"],
+            num_ratings=record["num_ratings"],
+            average_rating=record["average_rating"],
+            image_url=record["image_url"],
+            reviews=record["reviews"])
+
     async def is_correct_page_for_book(self):
         if self._is_correct_page_for_book is None:
             self._is_correct_page_for_book = (await self.analyse()).get("is_correct_product")
@@ -14,11 +14,16 @@ from slugify import slugify
 from smartllm import AsyncLLM
 from toml_i18n import i18n, TomlI18n
 
+import concurrency
+import html_parser
+from page_store import page_store
+
 if TYPE_CHECKING:
     from book_generator import BookGenerator
 
 
 class AudibleSearch(JSONCache):
+    PARSE_TARGETS = [html_parser.Target(class_="productListItem")]
 
     def __init__(self, bg: "BookGenerator"):
         self.book_generator = bg
@@ -40,10 +45,16 @@ class AudibleSearch(JSONCache):
     def __repr__(self):
         return self.__str__()
 
-    async def _get_soup_from_scrape(self):
-        html = await self.scraper.html()
+    async def _scrape_html(self):
+        async with concurrency.pool("scraping"):
+            html = await self.scraper.html()
         self.scraper.json_cache_save()
-        self._soup = BeautifulSoup(html, "html.parser")
+        return html
+
+    async def _get_soup_from_scrape(self):
+        html = await page_store.fetch(
+                self.url, kind="html", scrape=self._scrape_html, ttl=self.book_generator.ttl, refresh=self.book_generator.clear_cache)
+        self._soup = html_parser.parse(html, targets=self.PARSE_TARGETS)
         return self._soup
 
     async def soup(self):
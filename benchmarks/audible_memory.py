@@ -0,0 +1,52 @@
+# python -m benchmarks.audible_memory <sheet identifier> [<sheet identifier> ...]
+# runs the Audible part of each book in one process, like a batch does
+import asyncio
+import gc
+import resource
+import sys
+import tracemalloc
+from pathlib import Path
+
+from toml_i18n import TomlI18n
+
+from audible_finder import AudibleFinder
+from book_generator import BookGenerator
+
+
+def _mib(size: int) -> float:
+    return size / 1024 / 1024
+
+
+def _max_rss() -> int:
+    # ru_maxrss is reported in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def measure_book(sheet_identifier: str) -> dict:
+    bg = BookGenerator(sheet_identifier=sheet_identifier)
+    TomlI18n.initialize(locale=bg.settings.language, fallback_locale="en", directory=str(Path(__file__).parent.parent / "i18n"))
+    finder = AudibleFinder(bg)
+
+    gc.collect()
+    tracemalloc.start()
+    await finder._load_all_pages()
+    with_pages = tracemalloc.get_traced_memory()[0]
+    products = await finder._reduce_pages_to_products()
+    gc.collect()
+    with_products = tracemalloc.get_traced_memory()[0]
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {"products": len(products), "with_pages": with_pages, "with_products": with_products, "peak": peak, "max_rss": _max_rss()}
+
+
+async def benchmark(sheet_identifiers: list[str]):
+    print(f"{'book':<40}{'products':>10}{'pages MiB':>12}{'records MiB':>13}{'peak MiB':>10}{'max RSS MiB':>13}")
+    for sheet_identifier in sheet_identifiers:
+        result = await measure_book(sheet_identifier)
+        print(f"{sheet_identifier[:38]:<40}{result['products']:>10}{_mib(result['with_pages']):>12.1f}"
+              f"{_mib(result['with_products']):>13.1f}{_mib(result['peak']):>10.1f}{_mib(result['max_rss']):>13.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark(sys.argv[1:]))
@@ -0,0 +1,77 @@
+# python -m benchmarks.html_parsing [fixture directory] [repetitions]
+# without fixtures in the directory, up to 20 stored Audible pages are exported from the page store first
+import gc
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+import html_parser
+from audible_page import AudiblePage
+from audible_search import AudibleSearch
+from page_store import page_store
+
+DEFAULT_FIXTURES = Path(__file__).parent / "fixtures" / "audible"
+MAX_EXPORTED_FIXTURES = 20
+
+
+def export_fixtures(directory: Path, limit: int = MAX_EXPORTED_FIXTURES) -> int:
+    directory.mkdir(parents=True, exist_ok=True)
+    exported = 0
+    for key, _, _ in page_store.storage.entries():
+        if exported >= limit:
+            break
+        if not key.startswith("html/"):
+            continue
+        entry = page_store.storage.get(key)
+        if entry and "audible." in entry.get("url", ""):
+            (directory / f"{key.split('/')[-1]}.html").write_text(entry["content"], encoding="utf-8")
+            exported += 1
+    return exported
+
+
+def _targets_for(html: str) -> list:
+    return AudibleSearch.PARSE_TARGETS if "productListItem" in html else AudiblePage.PARSE_TARGETS
+
+
+def measure(parse, documents: list[str], repetitions: int) -> tuple[float, float]:
+    gc.collect()
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        for html in documents:
+            parse(html)
+    seconds = (time.perf_counter() - start) / (repetitions * len(documents))
+
+    peak = 0
+    for html in documents:
+        tracemalloc.start()
+        soup = parse(html)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        del soup
+    return seconds, peak
+
+
+def benchmark(directory: Path = DEFAULT_FIXTURES, repetitions: int = 3):
+    if not list(directory.glob("*.html")):
+        print(f"Exported {export_fixtures(directory)} fixtures to {directory}")
+    documents = [path.read_text(encoding="utf-8") for path in sorted(directory.glob("*.html"))]
+    if not documents:
+        print("No fixtures found")
+        return
+
+    candidates = {"full soup (html.parser)": lambda html: BeautifulSoup(html, "html.parser")}
+    for backend in html_parser.AVAILABLE_BACKENDS:
+        candidates[f"targeted ({backend})"] = lambda html, backend=backend: html_parser.parse(html, targets=_targets_for(html), backend=backend)
+
+    print(f"{len(documents)} documents, {sum(len(d) for d in documents) / len(documents) / 1024:.0f} KiB on average")
+    print(f"{'parser':<28}{'ms / page':>12}{'peak MiB':>12}")
+    for name, parse in candidates.items():
+        seconds, peak = measure(parse, documents, repetitions)
+        print(f"{name:<28}{seconds * 1000:>12.1f}{peak / 1024 / 1024:>12.1f}")
+
+
+if __name__ == "__main__":
+    benchmark(Path(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_FIXTURES, *[int(a) for a in sys.argv[2:3]])
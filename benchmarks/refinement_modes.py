@@ -0,0 +1,43 @@
+# python -m benchmarks.refinement_modes <sheet identifier> [max topics]
+import asyncio
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+from toml_i18n import TomlI18n
+
+import llm_runner
+from book_generator import BookGenerator
+
+MODES = {"two_pass": "_refine_in_two_passes", "combined": "_refine_in_one_pass"}
+
+
+def _totals() -> Counter:
+    return sum(llm_runner.usage.values(), Counter())
+
+
+async def benchmark(sheet_identifier: str, max_topics: int = 3):
+    bg = BookGenerator(sheet_identifier=sheet_identifier)
+    TomlI18n.initialize(locale=bg.settings.language, fallback_locale="en", directory=str(Path(__file__).parent.parent / "i18n"))
+    topics = bg.article_writer.topics[:max_topics]
+    for topic in topics:
+        await topic.draft()
+
+    results = {}
+    for mode, method in MODES.items():
+        before = _totals()
+        start = time.perf_counter()
+        for topic in topics:
+            await getattr(topic, method)(use_cache=False)
+        used = _totals() - before
+        results[mode] = {"seconds": time.perf_counter() - start, **used}
+
+    print(f"{bg.settings.title} ({bg.settings.article_type}), {len(topics)} topics")
+    print(f"{'mode':<10}{'seconds':>10}{'calls':>8}{'prompt tokens':>16}{'response tokens':>18}")
+    for mode, result in results.items():
+        print(f"{mode:<10}{result['seconds']:>10.1f}{result.get('calls', 0):>8}{result.get('prompt_tokens', 0):>16}{result.get('response_tokens', 0):>18}")
+
+
+if __name__ == "__main__":
+    asyncio.run(benchmark(sys.argv[1], *[int(a) for a in sys.argv[2:3]]))
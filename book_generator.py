@@ -9,11 +9,16 @@ from toml_i18n import TomlI18n
 import _config as config
 import article_writer
 import book_settings
+import document_backend
 import source_finder
 import topic_finder
 import fact_finder
 import audible_finder
 import meta_writer
+from passage_index import PassageIndex
+from source_registry import SourceRegistry
+from sheet_writer import sheet_writer
+from stage_scheduler import StageScheduler
 
 def setup_toml18n():
     TomlI18n.initialize(locale="en", fallback_locale="en", directory=str(Path(__file__).parent / "i18n"))
@@ -27,7 +32,8 @@ class BookGenerator(JSONCache):
         super().__init__(data_id=f"{slugify(self.sheet_identifier)}", ttl=ttl, clear_cache=clear_cache, directory="data/book_generator")
         self.ttl = ttl
         self.clear_cache = clear_cache
-        self._excluded_cache_vars = ["api_key", "service_account_key"]
+        self._passage_index: asyncio.Future | None = None
+        self._excluded_cache_vars = ["api_key", "service_account_key", "_passage_index"]
 
     @property
     @Cached()
@@ -44,6 +50,11 @@ class BookGenerator(JSONCache):
     def source_finder(self):
         return source_finder.SourceFinder(bg=self)
 
+    @property
+    @Cached()
+    def source_registry(self):
+        return SourceRegistry(bg=self)
+
     @property
     def sources(self):
         return self.source_finder.source_contents
@@ -74,15 +85,30 @@ class BookGenerator(JSONCache):
     def article_writer(self):
         return article_writer.ArticleWriter(bg=self)
 
+    async def passage_index(self) -> PassageIndex:
+        if self._passage_index is None:
+            self._passage_index = asyncio.ensure_future(PassageIndex.from_sources(self.sources))
+        return await self._passage_index
+
     async def topics(self):
         return await self.article_writer.topics
 
     async def run(self):
         TomlI18n.initialize(locale=self.settings.language, fallback_locale="en", directory=str(Path(__file__).parent / "i18n"))
-        await self.source_finder.run()
-        await self.topic_finder.run()
-        await self.audible_finder.run()
-        await self.article_writer.run()
+        scheduler = StageScheduler(name=self.settings.title, after_stage=sheet_writer.flush)
+        scheduler.add("sources", self.source_finder.run)
+        scheduler.add("audible", self.audible_finder.run)
+        scheduler.add("key_facts", self.fact_finder.key_facts)
+        scheduler.add("topics", self.topic_finder.run, depends_on=["sources"])
+        scheduler.add("interesting_facts", self.fact_finder.interesting_facts, depends_on=["sources"])
+        scheduler.add("drafts", self.article_writer.write_topics, depends_on=["topics"])
+        scheduler.add("article", self.article_writer.assemble, depends_on=["drafts", "audible", "key_facts", "interesting_facts"])
+        try:
+            await scheduler.run()
+        finally:
+            await sheet_writer.flush()
+            await asyncio.to_thread(self.settings.refresh_snapshot)
+            await document_backend.flush()
 
 
 
@@ -1,14 +1,35 @@
 from typing import TYPE_CHECKING
+import hashlib
+import json
 import os
 from cacherator import Cached, JSONCache
+from logorator import Logger
 from slugify import slugify
 
 import _config
+from sheet_writer import sheet_writer
 
 if TYPE_CHECKING:
     from book_generator import BookGenerator
 
 
+def _text(value):
+    return str(value).strip()
+
+
+def _choice(*options):
+    def parse(value):
+        value = str(value).strip().lower().replace("-", "_")
+        if value not in options:
+            raise ValueError(f"'{value}' is not one of {', '.join(options)}")
+        return value
+    return parse
+
+
+def _languages(value):
+    return [language.strip() for language in str(value).split(",")]
+
+
 class BookSettings(JSONCache):
     DEFAULT_GENERAL_BASE = "openai"
     DEFAULT_GENERAL_MODEL = "gpt-4o"
@@ -24,6 +45,7 @@ class BookSettings(JSONCache):
     DEFAULT_SEARCH_API_KEY = os.environ.get("PERPLEXITY_API_KEY")
 
     DEFAULT_BRAVE_API_KEY = os.environ.get("BRAVE_API_KEY")
+    DEFAULT_SEARCH_REQUESTS_PER_SECOND = 20
 
 
     DEFAULT_ARTICLE_TYPE = "short"
@@ -34,6 +56,15 @@ class BookSettings(JSONCache):
     DEFAULT_MAX_SOURCES = 80
     DEFAULT_AUDIOBOOK_LANGUAGES = "english"
     DEFAULT_MAX_AUDIOBOOKS = 5
+    DEFAULT_AUDIBLE_DUPLICATE_MATCHING = "exact"
+    AUDIBLE_DUPLICATE_MATCHINGS = ("exact", "fuzzy")
+
+    DEFAULT_ANALYSIS_CHUNK_TOKENS = 30_000
+    DEFAULT_PASSAGES_PER_SOURCE = 6
+    DEFAULT_REFINEMENT_MODE = "two_pass"
+    DEFAULT_DOCUMENT_BACKEND = os.environ.get("BOOKGEN_DOCUMENT_BACKEND", "mirror")
+    DOCUMENT_BACKENDS = ("mirror", "local", "google")
+    REFINEMENT_MODES = ("two_pass", "combined")
 
     DEFAULT_SOURCE_SCRAPE_TIMEOUT = 20
     DEFAULT_SOURCE_SCRAPE_RETRIES = 3
@@ -43,43 +74,145 @@ class BookSettings(JSONCache):
 
     def __init__(self, bg: "BookGenerator") -> None:
         self.book_generator = bg
-        self.sheet = self.book_generator.sheet
-        data_id = f"{slugify(self.sheet.sheet_identifier)}"
+        data_id = f"{slugify(self.book_generator.sheet_identifier)}"
         self.service_account_file = _config.SERVICE_ACCOUNT_KEY_FILE
-        super().__init__(data_id=data_id, directory="data/book_settings", ttl=self.book_generator.ttl, clear_cache=True)
-        self._excluded_cache_vars = ["search_api_key"]
+        self._snapshot: dict | None = None
+        super().__init__(data_id=data_id, directory="data/book_settings", ttl=self.book_generator.ttl, clear_cache=self.book_generator.clear_cache)
+        self._checked_this_run = False
+        self._excluded_cache_vars = ["_checked_this_run"]
+
+    @classmethod
+    def _schema(cls) -> dict:
+        # setting -> (parser, default); values are parsed once per snapshot
+        return {
+            "title"                     : (_text, None),
+            "author"                    : (_text, None),
+            "asin"                      : (_text, None),
+            "language"                  : (_text, "en"),
+            "country"                   : (lambda v: _text(v).upper(), "US"),
+            "article_type"              : (_text, cls.DEFAULT_ARTICLE_TYPE),
+            "proposed_word_count"       : (int, 0),
+            "share_email"               : (_text, None),
+            "search_base"               : (_text, cls.DEFAULT_SEARCH_BASE),
+            "search_model"              : (_text, cls.DEFAULT_SEARCH_MODEL),
+            "search_requests_per_second": (float, cls.DEFAULT_SEARCH_REQUESTS_PER_SECOND),
+            "general_base"              : (_text, cls.DEFAULT_GENERAL_BASE),
+            "general_model"             : (_text, cls.DEFAULT_GENERAL_MODEL),
+            "complex_base"              : (_text, cls.DEFAULT_COMPLEX_BASE),
+            "complex_model"             : (_text, cls.DEFAULT_COMPLEX_MODEL),
+            "writing_base"              : (_text, cls.DEFAULT_WRITING_BASE),
+            "writing_model"             : (_text, cls.DEFAULT_WRITING_MODEL),
+            "min_source_length"         : (int, cls.DEFAULT_MIN_SOURCE_LENGTH),
+            "urls_per_search"           : (int, cls.DEFAULT_URLS_PER_SEARCH),
+            "num_search_refinements"    : (int, cls.DEFAULT_NUM_SEARCH_REFINEMENTS),
+            "analysis_chunk_tokens"     : (int, cls.DEFAULT_ANALYSIS_CHUNK_TOKENS),
+            "passages_per_source"       : (int, cls.DEFAULT_PASSAGES_PER_SOURCE),
+            "refinement_mode"           : (_choice(*cls.REFINEMENT_MODES), cls.DEFAULT_REFINEMENT_MODE),
+            "document_backend"          : (_choice(*cls.DOCUMENT_BACKENDS), cls.DEFAULT_DOCUMENT_BACKEND),
+            "final_article"             : (_text, None),
+            "min_coverage_rating"       : (int, cls.DEFAULT_MIN_COVERAGE_RATING),
+            "max_sources"               : (int, cls.DEFAULT_MAX_SOURCES),
+            "audiobook_languages"       : (_languages, _languages(cls.DEFAULT_AUDIOBOOK_LANGUAGES)),
+            "max_audiobooks"            : (int, cls.DEFAULT_MAX_AUDIOBOOKS),
+            "audible_duplicate_matching": (_choice(*cls.AUDIBLE_DUPLICATE_MATCHINGS), cls.DEFAULT_AUDIBLE_DUPLICATE_MATCHING),
+            "source_scrape_timeout"     : (int, cls.DEFAULT_SOURCE_SCRAPE_TIMEOUT),
+            "source_scrape_retries"     : (int, cls.DEFAULT_SOURCE_SCRAPE_RETRIES),
+            "audible_scrape_timeout"    : (int, cls.DEFAULT_AUDIBLE_SCRAPE_TIMEOUT),
+            "audible_scrape_retries"    : (int, cls.DEFAULT_AUDIBLE_SCRAPE_RETRIES)}
+
+    @classmethod
+    def _parse(cls, raw: dict) -> dict:
+        values = {}
+        for key, (parse, default) in cls._schema().items():
+            value = raw.get(key)
+            if value is None or value == "":
+                values[key] = default
+                continue
+            try:
+                values[key] = parse(value)
+            except (TypeError, ValueError) as e:
+                Logger.note(f"Invalid setting {key}={value!r} ({e}), using {default!r}")
+                values[key] = default
+        return values
+
+    @staticmethod
+    def _hash(raw: dict) -> str:
+        # api keys don't change what gets generated, so they stay out of the hash
+        relevant = {key: value for key, value in raw.items() if not key.endswith("api_key")}
+        return hashlib.sha256(json.dumps(relevant, sort_keys=True, default=str).encode()).hexdigest()
+
+    @property
+    def sheet(self):
+        return self.book_generator.sheet
 
     @property
     @Cached()
     def _settings_tab(self):
-        return self.sheet.tab(tab_name="Settings", data_format="dict")
+        return sheet_writer.track(self.sheet.tab(tab_name="Settings", data_format="dict"))
 
-    @property
-    @Cached()
-    def _settings(self):
+    def _read_settings_tab(self) -> dict:
         data = {item['Key']: item['Value'] for item in self._settings_tab.data}
-        result = {key.strip().lower().replace(' ', '_'): value for key, value in data.items()}
-        return result
+        return {key.strip().lower().replace(' ', '_'): value for key, value in data.items()}
+
+    def _sheet_revision(self) -> str | None:
+        # Drive's modifiedTime changes with every edit of the spreadsheet and costs one metadata request
+        try:
+            return self.sheet.sheet.get_lastUpdateTime()
+        except Exception as e:
+            Logger.note(f"Could not read the revision of {self.sheet}: {e}")
+            return None
+
+    def _take_snapshot(self, raw: dict, revision: str | None = None) -> dict:
+        content_hash = self._hash(raw)
+        if self._snapshot is not None and self._snapshot.get("hash") == content_hash:
+            values = self._snapshot["values"]
+        else:
+            values = self._parse(raw)
+        return {"hash": content_hash, "revision": revision, "raw": raw, "values": values}
+
+    @property
+    def snapshot(self) -> dict:
+        if not self._checked_this_run:
+            revision = self._sheet_revision()
+            if self._snapshot is not None and revision is not None and self._snapshot.get("revision") == revision:
+                Logger.note(f"Settings unchanged since {revision}, using snapshot {self._snapshot['hash'][:12]}")
+            else:
+                self._snapshot = self._take_snapshot(self._read_settings_tab(), revision=revision)
+                self.json_cache_save()
+            self._checked_this_run = True
+        return self._snapshot
+
+    @property
+    def _settings(self) -> dict:
+        return self.snapshot["raw"]
+
+    @property
+    def _values(self) -> dict:
+        return self.snapshot["values"]
 
     @property
     def title(self):
-        return self._settings.get("title", None)
+        return self._values["title"]
 
     @property
     def author(self):
-        return self._settings.get("author", None)
+        return self._values["author"]
+
+    @property
+    def asin(self):
+        return self._values["asin"]
 
     @property
     def language(self):
-        return self._settings.get("language", "en")
+        return self._values["language"]
 
     @property
     def country(self):
-        return self._settings.get("country", "US").upper()
+        return self._values["country"]
 
     @property
     def article_type(self):
-        return self._settings.get("article_type", self.DEFAULT_ARTICLE_TYPE)
+        return self._values["article_type"]
 
     @property
     def article_type_key(self):
@@ -87,10 +220,7 @@ class BookSettings(JSONCache):
 
     @property
     def proposed_word_count(self):
-        try:
-            return int(self._settings.get("proposed_word_count", 0))
-        except:
-            return 0
+        return self._values["proposed_word_count"]
 
     @property
     def word_count_is_set(self):
@@ -98,115 +228,142 @@ class BookSettings(JSONCache):
 
     @property
     def search_base(self):
-        return self._settings.get("search_base", self.DEFAULT_SEARCH_BASE)
+        return self._values["search_base"]
 
     @property
     def search_model(self):
-        return self._settings.get("search_model", self.DEFAULT_SEARCH_MODEL)
+        return self._values["search_model"]
 
     @property
     def search_api_key(self):
-        return self._settings.get("search_api_key", self.DEFAULT_SEARCH_API_KEY)
+        return self._settings.get("search_api_key") or self.DEFAULT_SEARCH_API_KEY
+
+    @property
+    def search_requests_per_second(self):
+        return self._values["search_requests_per_second"]
 
     @property
     def email(self):
-        return self._settings.get("share_email", None)
+        return self._values["share_email"]
 
     @property
     def general_base(self):
-        return self._settings.get("general_base", self.DEFAULT_GENERAL_BASE)
+        return self._values["general_base"]
 
     @property
     def general_model(self):
-        return self._settings.get("general_model", self.DEFAULT_GENERAL_MODEL)
+        return self._values["general_model"]
 
     @property
     def general_api_key(self):
-        return self._settings.get("general_api_key", self.DEFAULT_GENERAL_API_KEY)
+        return self._settings.get("general_api_key") or self.DEFAULT_GENERAL_API_KEY
 
     @property
     def complex_base(self):
-        return self._settings.get("complex_base", self.DEFAULT_COMPLEX_BASE)
+        return self._values["complex_base"]
 
     @property
     def complex_model(self):
-        return self._settings.get("complex_model", self.DEFAULT_COMPLEX_MODEL)
+        return self._values["complex_model"]
 
     @property
     def complex_api_key(self):
-        return self._settings.get("complex_api_key", self.DEFAULT_COMPLEX_API_KEY)
+        return self._settings.get("complex_api_key") or self.DEFAULT_COMPLEX_API_KEY
 
     @property
     def writing_base(self):
-        return self._settings.get("writing_base", self.DEFAULT_WRITING_BASE)
+        return self._values["writing_base"]
 
     @property
     def writing_model(self):
-        return self._settings.get("writing_model", self.DEFAULT_WRITING_MODEL)
+        return self._values["writing_model"]
 
     @property
     def writing_api_key(self):
-        return self._settings.get("writing_api_key", self.DEFAULT_WRITING_API_KEY)
+        return self._settings.get("writing_api_key") or self.DEFAULT_WRITING_API_KEY
 
     @property
     def min_source_length(self):
-        return int(self._settings.get("min_source_length", self.DEFAULT_MIN_SOURCE_LENGTH))
+        return self._values["min_source_length"]
 
     @property
     def urls_per_search(self):
-        return int(self._settings.get("urls_per_search", self.DEFAULT_URLS_PER_SEARCH))
+        return self._values["urls_per_search"]
 
     @property
     def num_search_refinements(self):
-        return int(self._settings.get("num_search_refinements", self.DEFAULT_NUM_SEARCH_REFINEMENTS))
+        return self._values["num_search_refinements"]
+
+    @property
+    def analysis_chunk_tokens(self):
+        return self._values["analysis_chunk_tokens"]
+
+    @property
+    def passages_per_source(self):
+        return self._values["passages_per_source"]
+
+    @property
+    def refinement_mode(self):
+        return self._values["refinement_mode"]
+
+    @property
+    def document_backend(self):
+        return self._values["document_backend"]
 
     @property
     def final_article_url(self):
-        return self._settings.get("final_article", None)
+        return self._values["final_article"]
 
     @property
     def min_coverage_rating(self):
-        try:
-            return int(self._settings.get("min_coverage_rating", self.DEFAULT_MIN_COVERAGE_RATING))
-        except ValueError:
-            return 7
+        return self._values["min_coverage_rating"]
 
     @property
     def max_sources(self):
-        try:
-            return int(self._settings.get("max_sources", self.DEFAULT_MAX_SOURCES))
-        except ValueError:
-            return 80
+        return self._values["max_sources"]
 
     @property
     def audiobook_languages(self):
-        languages_string = self._settings.get("audiobook_languages", self.DEFAULT_AUDIOBOOK_LANGUAGES)
-        languages = [l.strip() for l in languages_string.split(",")]
-        return languages
+        return self._values["audiobook_languages"]
 
     @property
     def max_audiobooks(self):
-        try:
-            return int(self._settings.get("max_audiobooks", self.DEFAULT_MAX_AUDIOBOOKS))
-        except ValueError:
-            return self.DEFAULT_MAX_AUDIOBOOKS
+        return self._values["max_audiobooks"]
+
+    @property
+    def audible_duplicate_matching(self):
+        return self._values["audible_duplicate_matching"]
 
     def set(self, key="", value=""):
         self._settings_tab.update_row_by_column_pattern(column="Key", value=key, updates={"Value": value})
-        self._settings_tab.write_data()
+        sheet_writer.write(self._settings_tab)
+        revision = self._snapshot.get("revision") if self._snapshot else None
+        self._snapshot = self._take_snapshot({**self._settings, key.strip().lower().replace(' ', '_'): value}, revision=revision)
+        self.json_cache_save()
+
+    def refresh_snapshot(self):
+        # the run's own writes change the sheet's revision; recording the revision they leave behind
+        # lets the next run skip reading the tab. The revision is read first, so later edits still count.
+        revision = self._sheet_revision()
+        if revision is None:
+            return
+        self._settings_tab.refresh()
+        sheet_writer.track(self._settings_tab)
+        self._snapshot = self._take_snapshot(self._read_settings_tab(), revision=revision)
+        self.json_cache_save()
 
     @property
     def source_scrape_timeout(self):
-        return int(self._settings.get("source_scrape_timeout", self.DEFAULT_SOURCE_SCRAPE_TIMEOUT))
+        return self._values["source_scrape_timeout"]
 
     @property
     def source_scrape_retries(self):
-        return int(self._settings.get("source_scrape_retries", self.DEFAULT_SOURCE_SCRAPE_RETRIES))
+        return self._values["source_scrape_retries"]
 
     @property
     def audible_scrape_timeout(self):
-        return int(self._settings.get("audible_scrape_timeout", self.DEFAULT_AUDIBLE_SCRAPE_TIMEOUT))
+        return self._values["audible_scrape_timeout"]
 
     @property
     def audible_scrape_retries(self):
-        return int(self._settings.get("audible_scrape_retries", self.DEFAULT_AUDIBLE_SCRAPE_RETRIES))
\ No newline at end of file
+        return self._values["audible_scrape_retries"]
@@ -76,6 +76,8 @@ class BookWorker(JSONCache):
         settings = []
         settings.append({"Key": "Title", "Value": await self.title()})
         settings.append({"Key": "Author", "Value": await self.author()})
+        if self.asin:
+            settings.append({"Key": "ASIN", "Value": self.asin})
         settings.append({"Key": "Language", "Value": self.language})
         settings.append({"Key": "Country", "Value": self.country})
         settings.append({"Key": "Num search refinements", "Value": BookSettings.DEFAULT_NUM_SEARCH_REFINEMENTS})
@@ -0,0 +1,139 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from logorator import Logger
+
+from rate_limiter import is_rate_limit_error
+
+
+def is_overload_error(error: BaseException) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    if is_rate_limit_error(error):
+        return True
+    message = str(error).lower()
+    return "timeout" in message or "timed out" in message or "overloaded" in message
+
+
+class AdaptivePool:
+    INCREASE_STEP = 1.0  # per window of completed calls
+    DECREASE_FACTOR = 0.5
+    DECREASE_COOLDOWN = 2.0  # seconds
+
+    def __init__(self, name: str, initial: int, minimum: int = 1, maximum: int | None = None):
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum or initial
+        self.limit = float(initial)
+        self.in_flight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+
+    def __str__(self):
+        return f"AdaptivePool {self.name} ({self.in_flight}/{int(self.limit)})"
+
+    def __repr__(self):
+        return self.__str__()
+
+    async def acquire(self):
+        if not self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self, succeeded: bool = False, overloaded: bool = False):
+        self.in_flight -= 1
+        if overloaded:
+            self._decrease()
+        elif succeeded:
+            self.limit = min(float(self.maximum), self.limit + self.INCREASE_STEP / self.limit)
+        self._wake_waiters()
+
+    def _decrease(self):
+        now = time.monotonic()
+        if now - self._last_decrease < self.DECREASE_COOLDOWN:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.minimum), self.limit * self.DECREASE_FACTOR)
+        Logger.note(f"{self}: backing off after overload")
+
+    def _wake_waiters(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+
+
+class ConcurrencyLimiter:
+    DEFAULT_POOLS = {
+        # name: (initial, minimum, maximum)
+        "scraping"   : (20, 2, 60),
+        "llm"        : (40, 4, 120),
+        "writing_llm": (10, 2, 40),
+        "google"     : (4, 1, 16)}
+
+    def __init__(self, pools: dict[str, tuple[int, int, int]] | None = None):
+        self.pool_settings = {**self.DEFAULT_POOLS, **(pools or {})}
+        self._pools: dict[str, AdaptivePool] = {}
+
+    def __str__(self):
+        return f"ConcurrencyLimiter ({list(self._pools.values())})"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def configure(self, **pools: tuple[int, int, int]):
+        for name, settings in pools.items():
+            if name in self._pools:
+                raise ValueError(f"Pool '{name}' is already in use and cannot be reconfigured")
+            self.pool_settings[name] = settings
+
+    def maximum(self, name: str) -> int:
+        return self._pool(name).maximum
+
+    def _pool(self, name: str) -> AdaptivePool:
+        if name not in self.pool_settings:
+            raise KeyError(f"Unknown concurrency pool '{name}'")
+        if name not in self._pools:
+            initial, minimum, maximum = self.pool_settings[name]
+            self._pools[name] = AdaptivePool(name=name, initial=initial, minimum=minimum, maximum=maximum)
+        return self._pools[name]
+
+    @asynccontextmanager
+    async def pool(self, name: str):
+        pool = self._pool(name)
+        await pool.acquire()
+        succeeded = False
+        overloaded = False
+        try:
+            yield pool
+            succeeded = True
+        except Exception as e:
+            overloaded = is_overload_error(e)
+            raise
+        finally:
+            pool.release(succeeded=succeeded, overloaded=overloaded)
+
+
+limiter = ConcurrencyLimiter()
+
+
+def configure(**pools: tuple[int, int, int]):
+    limiter.configure(**pools)
+
+
+def pool(name: str):
+    return limiter.pool(name)
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from docorator import Docorator
+from logorator import Logger
+from slugify import slugify
+
+import concurrency
+
+if TYPE_CHECKING:
+    from book_generator import BookGenerator
+
+DEFAULT_DIRECTORY = "data/documents"
+MANIFEST_NAME = "manifest.json"
+
+
+class LocalDocument:
+
+    def __init__(self, document_name: str, directory: str = DEFAULT_DIRECTORY):
+        self.document_name = document_name
+        self.directory = Path(directory)
+        self.path = self.directory / f"{slugify(document_name)}.md"
+
+    def __str__(self):
+        return f"LocalDocument ({self.path})"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def _manifest(self) -> dict:
+        try:
+            return json.loads((self.directory / MANIFEST_NAME).read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def manifest_entry(self) -> dict:
+        return self._manifest().get(self.document_name, {})
+
+    def update_manifest(self, **values):
+        manifest_path = self.directory / MANIFEST_NAME
+        manifest = self._manifest()
+        entry = manifest.setdefault(self.document_name, {"file": self.path.name})
+        entry.update(values)
+        temporary_path = manifest_path.with_name(f"{MANIFEST_NAME}.tmp")
+        temporary_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+        temporary_path.replace(manifest_path)
+
+    async def initialize(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    async def export_as_markdown(self) -> str:
+        try:
+            return self.path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return ""
+
+    async def update_from_markdown(self, markdown_text: str = ""):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temporary_path = self.path.with_name(f"{self.path.name}.tmp")
+        temporary_path.write_text(markdown_text, encoding="utf-8")
+        temporary_path.replace(self.path)
+        self.update_manifest(updated_at=time.time(), words=len(markdown_text.split()))
+
+    async def sync(self):
+        pass
+
+    def url(self) -> str:
+        return self.path.resolve().as_uri()
+
+
+class GoogleDocument:
+
+    def __init__(self, document_name: str, service_account_file: str, clear_cache: bool = False):
+        self.document_name = document_name
+        self.docorator = Docorator(service_account_file=service_account_file, document_name=document_name, clear_cache=clear_cache)
+        self.initialized = False
+
+    def __str__(self):
+        return f"GoogleDocument ({self.document_name})"
+
+    def __repr__(self):
+        return self.__str__()
+
+    async def initialize(self):
+        if not self.initialized:
+            async with concurrency.pool("google"):
+                await self.docorator.initialize()
+            self.initialized = True
+
+    async def export_as_markdown(self) -> str:
+        await self.initialize()
+        async with concurrency.pool("google"):
+            return await self.docorator.export_as_markdown()
+
+    async def update_from_markdown(self, markdown_text: str = ""):
+        await self.initialize()
+        async with concurrency.pool("google"):
+            updated = await self.docorator.update_from_markdown(markdown_text=markdown_text)
+        if not updated:
+            raise RuntimeError(f"{self}: Google Docs rejected the update")
+
+    async def sync(self):
+        await self.initialize()
+
+    def exists_remotely(self) -> bool:
+        # Docorator restores the document id from its own cache for documents created by earlier runs
+        return bool(self.docorator.document_id)
+
+    def url(self) -> str:
+        return self.docorator.url()
+
+
+class MirroredDocument:
+    # writes go to disk immediately; Google Docs receives the latest version in the background
+
+    def __init__(self, local: LocalDocument, google: GoogleDocument):
+        self.local = local
+        self.google = google
+        self._pending_text: str | None = None
+        self._mirror_task: asyncio.Task | None = None
+        self._mirror_error: Exception | None = None
+
+    def __str__(self):
+        return f"MirroredDocument ({self.local.path} -> {self.google.document_name})"
+
+    def __repr__(self):
+        return self.__str__()
+
+    async def initialize(self):
+        await self.local.initialize()
+
+    async def export_as_markdown(self) -> str:
+        markdown = await self.local.export_as_markdown()
+        if not markdown and (self.google.exists_remotely() or self.local.manifest_entry().get("google_url")):
+            # documents written before the local backend existed only live in Google Docs
+            markdown = await self.google.export_as_markdown()
+            if markdown:
+                await self.local.update_from_markdown(markdown_text=markdown)
+        return markdown
+
+    async def update_from_markdown(self, markdown_text: str = ""):
+        await self.local.update_from_markdown(markdown_text=markdown_text)
+        self._pending_text = markdown_text
+        if self._mirror_task is None or self._mirror_task.done():
+            self._mirror_task = asyncio.create_task(self._mirror())
+            mirror_tasks.add(self._mirror_task)
+            self._mirror_task.add_done_callback(mirror_tasks.discard)
+
+    async def _mirror(self):
+        while self._pending_text is not None:
+            markdown_text, self._pending_text = self._pending_text, None
+            try:
+                await self.google.update_from_markdown(markdown_text=markdown_text)
+                self.local.update_manifest(google_url=self.google.url(), mirrored_at=time.time())
+                self._mirror_error = None
+                failed_mirrors.pop(self.local.document_name, None)
+            except Exception as e:
+                Logger.note(f"{self}: mirroring failed: {e}")
+                self._mirror_error = e
+                failed_mirrors[self.local.document_name] = e
+
+    async def sync(self):
+        # waits for the mirror, raises its last failure and makes sure url() points to Google Docs
+        if self._mirror_task is not None:
+            await self._mirror_task
+        if self._mirror_error is not None:
+            error, self._mirror_error = self._mirror_error, None
+            raise error
+        await self.google.sync()
+
+    def url(self) -> str:
+        return self.google.url() if self.google.initialized else self.local.url()
+
+
+mirror_tasks: set[asyncio.Task] = set()
+
+
+failed_mirrors: dict[str, Exception] = {}
+
+
+@Logger()
+async def flush():
+    while mirror_tasks:
+        await asyncio.gather(*list(mirror_tasks), return_exceptions=True)
+    if failed_mirrors:
+        names = ", ".join(failed_mirrors)
+        failed_mirrors.clear()
+        raise RuntimeError(f"Mirroring to Google Docs failed for: {names}")
+
+
+def open_document(bg: "BookGenerator", document_name: str):
+    backend = bg.settings.document_backend
+    if backend == "local":
+        return LocalDocument(document_name)
+    google = GoogleDocument(document_name, service_account_file=bg.settings.service_account_file, clear_cache=bg.clear_cache)
+    if backend == "google":
+        return google
+    if backend == "mirror":
+        return MirroredDocument(LocalDocument(document_name), google)
+    raise ValueError(f"Unknown document backend '{backend}'")
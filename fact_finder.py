@@ -1,4 +1,3 @@
-import os
 from itertools import chain
 from typing import TYPE_CHECKING
 
@@ -13,7 +12,8 @@ from pathlib import Path
 from toml_i18n import i18n
 import yaml
 
-from smartllm import AsyncLLM, SmartLLM
+import token_budget
+from llm_runner import execute_llm
 
 
 class FactFinder(JSONCache):
@@ -24,6 +24,8 @@ class FactFinder(JSONCache):
         data_id = f"{slugify(self.sheet_identifier)}"
         self._content = ""
         super().__init__(data_id=data_id, directory="data/fact_finder", ttl=self.book_generator.ttl, clear_cache=self.book_generator.clear_cache)
+        self._key_facts: dict | None = None
+        self._interesting_facts: list | None = None
 
     @property
     def sources(self):
@@ -38,12 +40,17 @@ class FactFinder(JSONCache):
     async def _synthesize_interesting_facts(self):
         with open(str(Path(__file__).parent / "i18n/fact_finder.synthesize_interesting_facts.yaml"), "r") as f:
             json_schema = yaml.safe_load(f)
-        prompt = i18n(
-                "fact_finder.synthesize_facts",
-                title=self.book_generator.settings.title,
-                author=self.book_generator.settings.author,
-                facts=await self._all_interesting_facts())
-        llm = AsyncLLM(
+        def build_prompt(facts):
+            return i18n(
+                    "fact_finder.synthesize_facts",
+                    title=self.book_generator.settings.title,
+                    author=self.book_generator.settings.author,
+                    facts=facts)
+
+        facts = await self._all_interesting_facts()
+        prompt = build_prompt(token_budget.fit_items(facts, token_budget.remaining_tokens(build_prompt([]))))
+        response = await execute_llm(
+                stage="fact_finder.synthesize_facts",
                 base=self.book_generator.settings.complex_base,
                 model=self.book_generator.settings.complex_model,
                 api_key=self.book_generator.settings.complex_api_key,
@@ -53,18 +60,21 @@ class FactFinder(JSONCache):
                 max_output_tokens=50_000,
                 json_mode=True,
                 json_schema=json_schema)
-        await llm.execute()
 
-        result = llm.response.get("interesting_facts", [])
+        result = response.get("interesting_facts", [])
         return result
 
     @Logger()
     async def _get_key_facts(self):
         prompt = i18n(
                 "fact_finder.get_key_facts", title=self.book_generator.settings.title, author=self.book_generator.settings.author)
-        llm = SmartLLM(base="perplexity", model="sonar-pro", api_key=os.environ.get("PERPLEXITY_API_KEY"), prompt=prompt)
-        llm.execute()
-        return llm.response
+        response = await execute_llm(
+                base=self.book_generator.settings.search_base,
+                model=self.book_generator.settings.search_model,
+                api_key=self.book_generator.settings.search_api_key,
+                prompt=prompt,
+                stage="fact_finder.get_key_facts")
+        return response
 
     @Logger()
     async def _organize_key_facts(self):
@@ -78,7 +88,8 @@ class FactFinder(JSONCache):
                 author=self.book_generator.settings.author,
                 facts=await self._get_key_facts())
 
-        llm = AsyncLLM(
+        response = await execute_llm(
+                stage="fact_finder.organize_key_facts",
                 base=self.book_generator.settings.general_base,
                 model=self.book_generator.settings.general_model,
                 api_key=self.book_generator.settings.general_api_key,
@@ -88,17 +99,23 @@ class FactFinder(JSONCache):
                 max_output_tokens=50_000,
                 json_mode=True,
                 json_schema=json_schema)
-        await llm.execute()
 
-        result = llm.response
+        result = response
         return result
 
     @Logger()
     async def key_facts(self):
-        result = await self._organize_key_facts()
-        result["author"] = self.book_generator.settings.author
-        result["title"] = self.book_generator.settings.title
-        return result
+        if self._key_facts is None:
+            result = await self._organize_key_facts()
+            result["author"] = self.book_generator.settings.author
+            result["title"] = self.book_generator.settings.title
+            self._key_facts = result
+        return self._key_facts
+
+    async def interesting_facts(self):
+        if self._interesting_facts is None:
+            self._interesting_facts = await self._synthesize_interesting_facts()
+        return self._interesting_facts
 
     async def key_facts_table(self):
         facts = await self.key_facts()
@@ -115,7 +132,7 @@ class FactFinder(JSONCache):
 
     async def interesting_facts_list(self):
         result = ""
-        facts = await self._synthesize_interesting_facts()
+        facts = await self.interesting_facts()
         for fact in facts:
             result+=f"- {fact}\n"
         return result
\ No newline at end of file
@@ -0,0 +1,68 @@
+import hashlib
+import random
+import re
+from collections import defaultdict
+
+NUM_PERMUTATIONS = 64
+NUM_BANDS = 16  # NUM_PERMUTATIONS / NUM_BANDS rows per band
+SHINGLE_SIZE = 5  # words
+SIMILARITY_THRESHOLD = 0.8
+_PRIME = (1 << 61) - 1
+_random = random.Random(1009)
+_PERMUTATIONS = [(_random.randrange(1, _PRIME), _random.randrange(0, _PRIME)) for _ in range(NUM_PERMUTATIONS)]
+
+
+def _shingle_hashes(text: str) -> set[int]:
+    words = re.findall(r"\w+", text.casefold())
+    if len(words) < SHINGLE_SIZE:
+        words = words + [""] * (SHINGLE_SIZE - len(words))
+    return {
+        int.from_bytes(hashlib.blake2b(" ".join(words[i:i + SHINGLE_SIZE]).encode(), digest_size=8).digest(), "big")
+        for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text: str) -> list[int]:
+    hashes = _shingle_hashes(text)
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def similarity(signature_1: list[int], signature_2: list[int]) -> float:
+    return sum(1 for x, y in zip(signature_1, signature_2) if x == y) / NUM_PERMUTATIONS
+
+
+def _bands(signature: list[int]) -> list[str]:
+    rows = NUM_PERMUTATIONS // NUM_BANDS
+    return [
+        f"band/{i}/{hashlib.sha1(str(signature[i * rows:(i + 1) * rows]).encode()).hexdigest()}"
+        for i in range(NUM_BANDS)]
+
+
+class FingerprintIndex:
+    # in-memory LSH index for one book; sources of other books are analysed for their own articles anyway
+
+    def __init__(self):
+        self._signatures: dict[str, list[int]] = {}
+        self._bands: dict[str, set[str]] = defaultdict(set)
+
+    def __str__(self):
+        return f"FingerprintIndex ({len(self._signatures)} signatures)"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def add(self, url: str, signature: list[int]):
+        self._signatures[url] = signature
+        for band in _bands(signature):
+            self._bands[band].add(url)
+
+    def find(self, signature: list[int], threshold: float = SIMILARITY_THRESHOLD) -> list[tuple[str, float]]:
+        candidates = {url for band in _bands(signature) for url in self._bands.get(band, ())}
+        result = []
+        for url in candidates:
+            score = similarity(signature, self._signatures[url])
+            if score >= threshold:
+                result.append((url, score))
+        return sorted(result, key=lambda match: (-match[1], match[0]))
@@ -1,9 +1,21 @@
+import math
 import re
+import unicodedata
 
 def clean_string(s):
     return re.sub(r'[^a-zA-Z0-9 ]+', '', s)
 
 
+def normalise_text(text: str | None, fuzzy: bool = False) -> str:
+    text = str(text or "").casefold()
+    if fuzzy:
+        # "Dune: Der Wüstenplanet (Ungekürzt)" and "Dune" are the same book in different search results
+        text = re.sub(r"[(\[].*?[)\]]", " ", text).split(":")[0]
+        text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+        text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
 def to_snake_case(s):
     # Replace spaces and hyphens with underscores
     s = re.sub(r"[ -]+", "_", s)
@@ -36,6 +48,11 @@ def to_float(value, fallback=0.0):
     except (ValueError, TypeError):
         return fallback
 
+
+def estimate_tokens(text) -> int:
+    # roughly four characters per token for English and German prose
+    return math.ceil(len(str(text)) / 4)
+
 async def main():
     import smartllm
     print(await smartllm.AsyncLLM(prompt="", base="openai").models())
@@ -0,0 +1,83 @@
+import os
+from importlib.util import find_spec
+
+from bs4 import BeautifulSoup
+from bs4.filter import ElementFilter
+
+BACKENDS = ("selectolax", "lxml", "html.parser")
+AVAILABLE_BACKENDS = [b for b in BACKENDS if b == "html.parser" or find_spec(b) is not None]
+DEFAULT_BACKEND = os.environ.get("BOOKGEN_HTML_PARSER", AVAILABLE_BACKENDS[0])
+TREE_BUILDER = "lxml" if "lxml" in AVAILABLE_BACKENDS else "html.parser"
+
+
+class Target:
+
+    def __init__(self, name: str | None = None, **attrs: str):
+        self.name = name
+        self.attrs = {key.rstrip("_"): value for key, value in attrs.items()}  # class_ -> class
+
+    def __str__(self):
+        return f"Target ({self.css})"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def matches(self, name: str, attrs: dict | None) -> bool:
+        if self.name is not None and name != self.name:
+            return False
+        attrs = attrs or {}
+        for key, value in self.attrs.items():
+            actual = attrs.get(key)
+            if key == "class":
+                # class is a space separated list, e.g. "bc-list-item productListItem"
+                classes = actual.split() if isinstance(actual, str) else (actual or [])
+                if value not in classes:
+                    return False
+            elif actual != value:
+                return False
+        return True
+
+    @property
+    def css(self) -> str:
+        selector = self.name or "*"
+        for key, value in self.attrs.items():
+            selector += f".{value}" if key == "class" else f'[{key}="{value}"]'
+        return selector
+
+
+class _TargetFilter(ElementFilter):
+    # one parsing pass: the tree builder only creates top-level tags that match a target, with their whole subtree
+
+    def __init__(self, targets: list[Target]):
+        super().__init__()
+        self.targets = targets
+
+    def allow_tag_creation(self, nsprefix, name, attrs) -> bool:
+        return any(target.matches(name, attrs) for target in self.targets)
+
+    def allow_string_creation(self, string: str) -> bool:
+        return False
+
+
+def _parse_with_filter(html: str, targets: list[Target], features: str) -> BeautifulSoup:
+    return BeautifulSoup(html, features, parse_only=_TargetFilter(targets))
+
+
+def _parse_with_selectolax(html: str, targets: list[Target]) -> BeautifulSoup:
+    from selectolax.parser import HTMLParser
+
+    nodes = HTMLParser(html).css(", ".join(t.css for t in targets))
+    return BeautifulSoup("".join(node.html for node in nodes), TREE_BUILDER)
+
+
+def parse(html: str, targets: list[Target] | None = None, backend: str = DEFAULT_BACKEND) -> BeautifulSoup:
+    # with targets, the soup only contains the matching elements and their subtrees
+    html = html or ""
+    if backend not in AVAILABLE_BACKENDS:
+        raise ValueError(f"HTML parser backend '{backend}' is not available (available: {', '.join(AVAILABLE_BACKENDS)})")
+    features = TREE_BUILDER if backend == "selectolax" else backend
+    if not targets:
+        return BeautifulSoup(html, features)
+    if backend == "selectolax":
+        return _parse_with_selectolax(html, targets)
+    return _parse_with_filter(html, targets, features)
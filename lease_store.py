@@ -0,0 +1,85 @@
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from logorator import Logger
+from slugify import slugify
+
+
+class LeaseStore:
+    DEFAULT_DIRECTORY = "data/leases"
+    DEFAULT_LEASE_DURATION = 600  # seconds
+
+    def __init__(self, name: str, directory: str = DEFAULT_DIRECTORY, lease_duration: int = DEFAULT_LEASE_DURATION, owner: str | None = None):
+        self.name = name
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path = self.directory / f"{slugify(name)}.sqlite"
+        self.lease_duration = lease_duration
+        self.owner = owner or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        with self._connect() as connection:
+            connection.execute(
+                """CREATE TABLE IF NOT EXISTS leases (
+                    key TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    heartbeat_at REAL NOT NULL,
+                    completed INTEGER NOT NULL DEFAULT 0)""")
+
+    def __str__(self):
+        return f"LeaseStore ({self.name}, {self.owner})"
+
+    def __repr__(self):
+        return self.__str__()
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def claim(self, key: str) -> bool:
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute("SELECT owner, expires_at, completed FROM leases WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                connection.execute(
+                    "INSERT INTO leases (key, owner, expires_at, heartbeat_at) VALUES (?, ?, ?, ?)",
+                    (key, self.owner, now + self.lease_duration, now))
+            else:
+                owner, expires_at, completed = row
+                if expires_at > now and (completed or owner != self.owner):
+                    connection.execute("ROLLBACK")
+                    return False
+                if owner != self.owner and not completed:
+                    Logger.note(f"{self}: taking over expired lease '{key}' from {owner}")
+                connection.execute(
+                    "UPDATE leases SET owner = ?, expires_at = ?, heartbeat_at = ?, completed = 0 WHERE key = ?",
+                    (self.owner, now + self.lease_duration, now, key))
+            connection.execute("COMMIT")
+            return True
+
+    def heartbeat(self, key: str) -> bool:
+        now = time.time()
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "UPDATE leases SET expires_at = ?, heartbeat_at = ? WHERE key = ? AND owner = ? AND completed = 0",
+                (now + self.lease_duration, now, key, self.owner))
+            return cursor.rowcount == 1
+
+    def release(self, key: str, completed: bool = False):
+        # a completed lease only blocks the key until the sheet shows the row as done; after that the Done
+        # column decides, so a row that is reset to 0 is picked up again
+        with self._connect() as connection:
+            if completed:
+                connection.execute("UPDATE leases SET completed = 1, expires_at = ? WHERE key = ? AND owner = ?",
+                                   (time.time() + self.lease_duration, key, self.owner))
+            else:
+                connection.execute("DELETE FROM leases WHERE key = ? AND owner = ? AND completed = 0", (key, self.owner))
@@ -0,0 +1,72 @@
+import hashlib
+import json
+import time
+
+from logorator import Logger
+
+import storage
+
+
+def _hash(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, ensure_ascii=False, default=str).encode()).hexdigest()
+
+
+class LLMResponseCache:
+    DEFAULT_DIRECTORY = "data/llm_cache"
+    DEFAULT_TTL = 30 * 24 * 60 * 60  # seconds
+    DEFAULT_MAX_SIZE = 512 * 1024 * 1024  # bytes
+    EVICTION_TARGET = 0.9  # share of max_size kept after an eviction
+
+    def __init__(self, directory: str = DEFAULT_DIRECTORY, ttl: int = DEFAULT_TTL, max_size: int = DEFAULT_MAX_SIZE, backend: str = storage.DEFAULT_BACKEND):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_size = max_size
+        self.backend = backend
+        self._storage = None
+
+    def __str__(self):
+        return f"LLMResponseCache ({self.directory})"
+
+    def __repr__(self):
+        return self.__str__()
+
+    @staticmethod
+    def key(base="", model="", temperature=None, json_mode=False, json_schema=None, prompt="", **_) -> str:
+        schema_hash = _hash({"json_mode": json_mode, "json_schema": json_schema})
+        prompt_hash = _hash(prompt)
+        return _hash([base, model, temperature, schema_hash, prompt_hash])
+
+    @property
+    def storage(self):
+        if self._storage is None:
+            self._storage = storage.open_storage(self.directory, backend=self.backend)
+        return self._storage
+
+    def get(self, key: str):
+        entry = self.storage.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry.get("created_at", 0) > self.ttl:
+            self.storage.delete(key)
+            return None
+        self.storage.touch(key)
+        return entry.get("response")
+
+    def set(self, key: str, response):
+        self.storage.set(key, {"created_at": time.time(), "response": response})
+        if self.storage.size() > self.max_size:
+            self.evict()
+
+    @Logger()
+    def evict(self):
+        now = time.time()
+        size = self.storage.size()
+        for key, entry_size, accessed_at in list(self.storage.entries()):
+            if size <= self.max_size * self.EVICTION_TARGET and now - accessed_at <= self.ttl:
+                break
+            self.storage.delete(key)
+            size -= entry_size
+        self.storage.flush()
+
+
+response_cache = LLMResponseCache()
@@ -0,0 +1,28 @@
+from collections import Counter, defaultdict
+
+from smartllm import AsyncLLM
+
+import concurrency
+import token_budget
+from helper import estimate_tokens
+from llm_cache import LLMResponseCache, response_cache
+
+usage: dict[str, Counter] = defaultdict(Counter)  # per stage: calls, cached, prompt_tokens, response_tokens
+
+
+async def execute_llm(pool: str = "llm", stage: str = "", use_cache: bool = True, **llm_arguments):
+    llm_arguments.setdefault("max_input_tokens", token_budget.DEFAULT_MAX_INPUT_TOKENS)
+    prompt_tokens = token_budget.check_prompt(llm_arguments.get("prompt", ""), llm_arguments["max_input_tokens"], stage=stage)
+    usage[stage].update(calls=1, prompt_tokens=prompt_tokens)
+    key = LLMResponseCache.key(**llm_arguments)
+    response = response_cache.get(key) if use_cache else None
+    if response is not None:
+        usage[stage].update(cached=1)
+        return response
+    async with concurrency.pool(pool):
+        llm = AsyncLLM(**llm_arguments)
+        await llm.execute()
+    usage[stage].update(response_tokens=estimate_tokens(llm.response or ""))
+    if llm.response:
+        response_cache.set(key, llm.response)
+    return llm.response
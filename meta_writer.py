@@ -4,9 +4,10 @@ from typing import TYPE_CHECKING
 
 import yaml
 from logorator import Logger
-from smartllm import AsyncLLM
 from toml_i18n import i18n
 
+from llm_runner import execute_llm
+
 if TYPE_CHECKING:
     from book_generator import BookGenerator
 
@@ -36,7 +37,9 @@ class MetaWriter(JSONCache):
                 author=self.book_generator.settings.author,
                 article=sections,
                 first_letter=random.choice(["a", "b", "d", "e", "f", "g", "h", "l", "m", "n", "p", "r", "s", "t"]))
-        llm = AsyncLLM(
+        response = await execute_llm(
+                pool="writing_llm",
+                stage="meta_writer.generate",
                 base=self.book_generator.settings.writing_base,
                 model=self.book_generator.settings.writing_model,
                 api_key=self.book_generator.settings.writing_api_key,
@@ -46,8 +49,7 @@ class MetaWriter(JSONCache):
                 max_output_tokens=50_000,
                 json_mode=True,
                 json_schema=json_schema)
-        await llm.execute()
-        self._meta_data = llm.response
+        self._meta_data = response
         self.json_cache_save()
         return self._meta_data
 
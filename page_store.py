@@ -0,0 +1,102 @@
+import asyncio
+import hashlib
+import time
+from typing import Awaitable, Callable
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+import requests
+from logorator import Logger
+
+import storage
+
+TRACKING_PARAMETER_PREFIXES = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid", "_ga", "igshid")
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def canonical_url(url: str) -> str:
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower() or "https"
+    host = (parsed.hostname or "").lower()
+    if parsed.port and parsed.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parsed.port}"
+    path = parsed.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/")
+    query = [(k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True) if not k.lower().startswith(TRACKING_PARAMETER_PREFIXES)]
+    return urlunparse((scheme, host, path, "", urlencode(sorted(query)), ""))
+
+
+class PageStore:
+    DEFAULT_DIRECTORY = "data/page_store"
+    DEFAULT_TTL = 14  # days
+    REVALIDATION_TIMEOUT = 10  # seconds
+
+    def __init__(self, directory: str = DEFAULT_DIRECTORY, ttl: float = DEFAULT_TTL, backend: str = storage.DEFAULT_BACKEND):
+        self.directory = directory
+        self.ttl = ttl
+        self.backend = backend
+        self._storage = None
+
+    def __str__(self):
+        return f"PageStore ({self.directory})"
+
+    def __repr__(self):
+        return self.__str__()
+
+    @property
+    def storage(self):
+        if self._storage is None:
+            self._storage = storage.open_storage(self.directory, backend=self.backend)
+        return self._storage
+
+    @staticmethod
+    def _key(url: str, kind: str) -> str:
+        return f"{kind}/{hashlib.sha256(canonical_url(url).encode()).hexdigest()}"
+
+    @staticmethod
+    def _is_fresh(entry: dict) -> bool:
+        return time.time() < entry.get("fetched_at", 0) + entry.get("ttl", 0) * 24 * 60 * 60
+
+    def _validators(self, url: str) -> dict:
+        try:
+            response = requests.head(url, allow_redirects=True, timeout=self.REVALIDATION_TIMEOUT)
+        except requests.RequestException:
+            return {}
+        return {k: v for k, v in {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}.items() if v}
+
+    def _is_unchanged(self, entry: dict) -> bool:
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        if not headers:
+            return False
+        try:
+            response = requests.head(entry["url"], headers=headers, allow_redirects=True, timeout=self.REVALIDATION_TIMEOUT)
+        except requests.RequestException:
+            return False
+        return response.status_code == 304
+
+    async def fetch(self, url: str, kind: str, scrape: Callable[[], Awaitable[str]], ttl: float | None = None, refresh: bool = False) -> str:
+        key = self._key(url, kind)
+        ttl = self.ttl if ttl is None else ttl
+        entry = None if refresh else self.storage.get(key)
+        if entry is not None:
+            if self._is_fresh(entry):
+                return entry["content"]
+            if await asyncio.to_thread(self._is_unchanged, entry):
+                Logger.note(f"{self}: {url} unchanged, extending stored {kind}")
+                entry["fetched_at"] = time.time()
+                entry["ttl"] = ttl
+                self.storage.set(key, entry)
+                return entry["content"]
+
+        content = await scrape()
+        if content:
+            validators = await asyncio.to_thread(self._validators, url)
+            self.storage.set(key, {"url": url, "fetched_at": time.time(), "ttl": ttl, "content": content, **validators})
+        return content
+
+
+page_store = PageStore()
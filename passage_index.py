@@ -0,0 +1,72 @@
+import asyncio
+import math
+import re
+from collections import Counter
+from typing import TYPE_CHECKING
+
+from logorator import Logger
+
+from source_analyzer import split_into_chunks
+
+if TYPE_CHECKING:
+    from source_content import SourceContent
+
+PASSAGE_TOKENS = 250
+K1 = 1.5
+B = 0.75
+
+
+def _terms(text: str) -> list[str]:
+    return [t for t in re.findall(r"\w+", text.casefold()) if len(t) > 1]
+
+
+class PassageIndex:
+
+    def __init__(self, passages: list[tuple[str, str]]):
+        # passages are (url, text) in document order
+        self.passages = passages
+        self._term_counts = [Counter(_terms(text)) for _, text in passages]
+        self._lengths = [sum(counts.values()) for counts in self._term_counts]
+        self._average_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0
+        document_frequency = Counter(term for counts in self._term_counts for term in counts)
+        n = len(passages)
+        self._idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in document_frequency.items()}
+        self._by_url: dict[str, list[int]] = {}
+        for i, (url, _) in enumerate(passages):
+            self._by_url.setdefault(url, []).append(i)
+
+    def __str__(self):
+        return f"PassageIndex ({len(self.passages)} passages, {len(self._by_url)} sources)"
+
+    def __repr__(self):
+        return self.__str__()
+
+    @classmethod
+    @Logger()
+    async def from_sources(cls, sources: list["SourceContent"], passage_tokens: int = PASSAGE_TOKENS) -> "PassageIndex":
+        passages = []
+        for source in sources:
+            if source.duplicate_of is not None:
+                continue
+            passages += [(source.url, chunk) for chunk in split_into_chunks(await source.text(), passage_tokens) if chunk.strip()]
+        index = await asyncio.to_thread(cls, passages)
+        Logger.note(str(index))
+        return index
+
+    def _score(self, i: int, query_terms: list[str]) -> float:
+        counts = self._term_counts[i]
+        length_norm = K1 * (1 - B + B * self._lengths[i] / (self._average_length or 1))
+        score = 0.0
+        for term in query_terms:
+            tf = counts.get(term, 0)
+            if tf:
+                score += self._idf[term] * tf * (K1 + 1) / (tf + length_norm)
+        return score
+
+    def search(self, query: str, k: int, url: str | None = None) -> list[str]:
+        candidates = self._by_url.get(url, []) if url is not None else range(len(self.passages))
+        query_terms = list(set(_terms(query)))
+        # passages without a single query term carry no evidence for the topic
+        scores = {i: score for i in candidates if (score := self._score(i, query_terms)) > 0}
+        ranked = sorted(scores, key=lambda i: -scores[i])[:k]
+        return [self.passages[i][1] for i in sorted(ranked)]
@@ -0,0 +1,64 @@
+import asyncio
+import hashlib
+import time
+
+
+class TokenBucket:
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def __str__(self):
+        return f"TokenBucket ({self.rate}/s, capacity {self.capacity})"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self, tokens: float = 1.0):
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        # a negative balance makes every caller sharing this bucket wait out the provider's back-off
+        self._refill()
+        self._tokens = min(self._tokens, 1.0 - seconds * self.rate)
+
+
+_buckets: dict[str, TokenBucket] = {}
+
+
+def bucket_for(api_key: str | None, rate: float, capacity: float | None = None) -> TokenBucket:
+    key = hashlib.sha256(str(api_key).encode()).hexdigest()
+    bucket = _buckets.get(key)
+    if bucket is None:
+        bucket = TokenBucket(rate=rate, capacity=capacity)
+        _buckets[key] = bucket
+    else:
+        bucket.rate = rate
+        bucket.capacity = capacity or max(1.0, rate)
+    return bucket
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    for attribute in ("status", "status_code", "code"):
+        if getattr(error, attribute, None) == 429:
+            return True
+    response = getattr(error, "response", None)
+    if response is not None and getattr(response, "status_code", getattr(response, "status", None)) == 429:
+        return True
+    message = str(error).lower()
+    return "429" in message or "rate limit" in message or "too many requests" in message
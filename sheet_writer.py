@@ -0,0 +1,139 @@
+import asyncio
+from itertools import zip_longest
+from typing import Callable
+
+from logorator import Logger
+
+import concurrency
+
+
+def _cells(tab) -> list[list]:
+    # the grid as the sheet holds it, header row included
+    try:
+        values = tab._data_as_list
+    except IndexError:  # an empty list of dicts has no header row
+        return []
+    return [["" if cell is None else cell for cell in row] for row in values]
+
+
+def _a1(row: int, column: int) -> str:
+    letters = ""
+    column += 1
+    while column:
+        column, remainder = divmod(column - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return f"{letters}{row + 1}"
+
+
+def changed_ranges(before: list[list], after: list[list]) -> list[dict]:
+    # one range per run of changed cells in a row; cells that disappeared are cleared
+    ranges = []
+    for row, (row_before, row_after) in enumerate(zip_longest(before, after, fillvalue=[])):
+        start, values = 0, []
+        for column, (cell_before, cell_after) in enumerate(zip_longest(row_before, row_after, fillvalue="")):
+            if cell_before != cell_after:
+                if not values:
+                    start = column
+                values.append(cell_after)
+            elif values:
+                ranges.append({"range": f"{_a1(row, start)}:{_a1(row, column - 1)}", "values": [values]})
+                values = []
+        if values:
+            ranges.append({"range": f"{_a1(row, start)}:{_a1(row, start + len(values) - 1)}", "values": [values]})
+    return ranges
+
+
+class _PendingWrite:
+
+    def __init__(self, tab, prepare: Callable | None, on_written: Callable | None, write_arguments: dict):
+        self.tab = tab
+        self.prepare = prepare
+        self.on_written = on_written
+        self.write_arguments = write_arguments
+
+
+class SheetWriter:
+    DEFAULT_FLUSH_INTERVAL = 10.0  # seconds
+
+    def __init__(self, flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._snapshots: dict[str, list[list]] = {}
+        self._pending: dict[str, _PendingWrite] = {}
+        self._timer: asyncio.Task | None = None
+        self._flush_lock: asyncio.Lock | None = None
+
+    def __str__(self):
+        return f"SheetWriter ({len(self._pending)} pending)"
+
+    def __repr__(self):
+        return self.__str__()
+
+    @staticmethod
+    def _key(tab) -> str:
+        return str(id(tab))
+
+    def track(self, tab, key: str | None = None):
+        # remember what the sheet holds right now, so later writes only send the cells that changed
+        self._snapshots[key or self._key(tab)] = _cells(tab)
+        return tab
+
+    def write(self, tab, key: str | None = None, prepare: Callable | None = None, on_written: Callable | None = None, **write_arguments):
+        # prepare runs in a worker thread at flush time and returns the tab to write, e.g. after re-reading it;
+        # on_written runs once the sheet holds that data, so callers can drop what they queued
+        self._pending[key or self._key(tab)] = _PendingWrite(tab, prepare, on_written, write_arguments)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self._flush_now()
+            return
+        if self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    def _write_if_changed(self, key: str, pending: _PendingWrite) -> int:
+        tab = pending.prepare() if pending.prepare is not None else pending.tab
+        cells = _cells(tab)
+        snapshot = self._snapshots.get(key)
+        if snapshot is None or pending.write_arguments.get("as_table"):
+            tab.write_data(**pending.write_arguments)
+            changed = sum(len(row) for row in cells)
+        else:
+            ranges = changed_ranges(snapshot, cells)
+            if ranges:
+                tab._worksheet.batch_update(ranges, value_input_option="USER_ENTERED")
+            changed = sum(len(changed_range["values"][0]) for changed_range in ranges)
+        self._snapshots[key] = cells
+        if pending.on_written is not None:
+            pending.on_written()
+        return changed
+
+    def _flush_now(self):
+        pending, self._pending = self._pending, {}
+        for key, write in pending.items():
+            self._write_if_changed(key, write)
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        try:
+            await self.flush()
+        except Exception as e:
+            Logger.note(f"{self}: flush failed: {e}")
+
+    async def flush(self):
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            pending, self._pending = self._pending, {}
+            errors = []
+            for key, write in pending.items():
+                try:
+                    async with concurrency.pool("google"):
+                        changed = await asyncio.to_thread(self._write_if_changed, key, write)
+                    Logger.note(f"{self}: {changed} changed cells in {write.tab}" if changed else f"{self}: {write.tab} unchanged, skipped")
+                except Exception as e:
+                    self._pending.setdefault(key, write)
+                    errors.append(e)
+            if errors:
+                raise errors[0]
+
+
+sheet_writer = SheetWriter()
@@ -1,4 +1,5 @@
 import os
+import re
 
 from cacherator import Cached, JSONCache
 from logorator import Logger
@@ -6,6 +7,63 @@ from slugify import slugify
 from smartllm import SmartLLM
 from toml_i18n import i18n
 
+from helper import estimate_tokens
+
+MAX_CONTENT_ANALYSIS_ITEMS = 7
+MAX_INTERESTING_FACTS = 20
+
+
+def _split_oversized(unit: str, max_tokens: int) -> list[str]:
+    if estimate_tokens(unit) <= max_tokens:
+        return [unit]
+    for pattern in (r"\n\s*\n", r"\n", r"(?<=[.!?])\s+"):
+        parts = [p for p in re.split(pattern, unit) if p.strip()]
+        if len(parts) > 1:
+            return [piece for part in parts for piece in _split_oversized(part, max_tokens)]
+    max_chars = max_tokens * 4
+    return [unit[i:i + max_chars] for i in range(0, len(unit), max_chars)]
+
+
+def split_into_chunks(text: str, max_tokens: int) -> list[str]:
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    sections = [s for s in re.split(r"\n(?=#{1,6}\s)", text) if s.strip()]
+    units = [unit for section in sections for unit in _split_oversized(section, max_tokens)]
+    chunks = []
+    current = ""
+    for unit in units:
+        candidate = f"{current}\n\n{unit}" if current else unit
+        if current and estimate_tokens(candidate) > max_tokens:
+            chunks.append(current)
+            current = unit
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def merge_content_analyses(analyses: list[dict]) -> dict:
+    topics: dict[str, dict] = {}
+    facts: dict[str, dict] = {}
+    for analysis in analyses:
+        for item in (analysis or {}).get("content_analysis", []):
+            key = str(item.get("content_name", "")).strip().casefold()
+            if key not in topics:
+                topics[key] = dict(item)
+                continue
+            topic = topics[key]
+            topic["coverage_rating"] = max(topic.get("coverage_rating", 0), item.get("coverage_rating", 0))
+            notes = item.get("analysis_notes", "")
+            if notes and notes not in topic.get("analysis_notes", ""):
+                topic["analysis_notes"] = f"{topic.get('analysis_notes', '')} {notes}".strip()
+        for item in (analysis or {}).get("interesting_facts", []):
+            facts.setdefault(str(item.get("fact", "")).strip().casefold(), item)
+    ranked_topics = sorted(topics.values(), key=lambda t: -t.get("coverage_rating", 0))  # stable, so ties keep page order
+    return {
+        "content_analysis" : ranked_topics[:MAX_CONTENT_ANALYSIS_ITEMS],
+        "interesting_facts": list(facts.values())[:MAX_INTERESTING_FACTS]}
+
 
 class SourceAnalyzer(JSONCache):
     def __init__(self, url: str, chunk: int, markdown: str, further_information: str = "", model: str = "claude-3-7-sonnet-20250219") -> None:
@@ -1,14 +1,21 @@
+import asyncio
 from pathlib import Path
 from typing import TYPE_CHECKING
 import traceback
 import yaml
-from cacherator import JSONCache
+from cacherator import Cached, JSONCache
 from ghostscraper import GhostScraper
 from logorator import Logger
 from slugify import slugify
-from smartllm import AsyncLLM
 from toml_i18n import i18n
 
+import concurrency
+from helper import estimate_tokens
+from llm_runner import execute_llm
+from page_store import page_store
+from source_analyzer import merge_content_analyses, split_into_chunks
+from text_cleaner import clean_text
+
 if TYPE_CHECKING:
     from book_generator import BookGenerator
 
@@ -17,20 +24,17 @@ class SourceContent(JSONCache):
 
     def __init__(self, bg: "BookGenerator", url=""):
         self.book_generator = bg
-        self._text: str | None = None
         self._content_analysis: dict | None = None
+        self._token_counts: dict | None = None
+        self.duplicate_of: str | None = None
         super().__init__(
                 data_id=f"{slugify(self.book_generator.settings.title)}_{slugify(url)}",
                 directory="data/sources",
                 clear_cache=self.book_generator.clear_cache,
                 ttl=self.book_generator.ttl)
         self.url = url
-        self.scraper = GhostScraper(
-            url=url,
-            clear_cache=self.book_generator.clear_cache,
-            ttl=self.book_generator.ttl,
-            load_timeout=self.book_generator.settings.source_scrape_timeout,
-            max_retries=self.book_generator.settings.source_scrape_retries)
+        self._text: str | None = None  # loaded lazily from the page store, not kept in this cache
+        self._excluded_cache_vars = ["_text"]
         self.email_sharing = self.book_generator.settings.email
         self.title = self.book_generator.settings.title
 
@@ -40,28 +44,57 @@ class SourceContent(JSONCache):
     def __repr__(self):
         return self.__str__()
 
+    @property
+    @Cached()
+    def scraper(self):
+        return GhostScraper(
+            url=self.url,
+            clear_cache=self.book_generator.clear_cache,
+            ttl=self.book_generator.ttl,
+            load_timeout=self.book_generator.settings.source_scrape_timeout,
+            max_retries=self.book_generator.settings.source_scrape_retries)
+
+    async def _scrape_text(self):
+        async with concurrency.pool("scraping"):
+            text = await self.scraper.text()
+        self.scraper.json_cache_save()
+        return text
+
     async def _get_text_from_scrape(self):
         try:
-            text = await self.scraper.text()
+            text = await page_store.fetch(
+                    self.url,
+                    kind="text",
+                    scrape=self._scrape_text,
+                    ttl=self.book_generator.ttl,
+                    refresh=self.book_generator.clear_cache)
         except Exception as e:
             Logger.note(str(e))
             Logger.note(traceback.format_exc())
             text = ""
-        self.scraper.json_cache_save()
-        self.json_cache_save()
         return text
 
+    def _clean_text(self, text: str) -> str:
+        cleaned = clean_text(text)
+        if self._token_counts is None:
+            self._token_counts = {"raw": estimate_tokens(text), "clean": estimate_tokens(cleaned)}
+            Logger.note(f"{self}: {self._token_counts['raw']} -> {self._token_counts['clean']} tokens after cleaning")
+            self.json_cache_save()
+        return cleaned
+
     async def text(self):
         if self._text is None:
-            self._text = await self._get_text_from_scrape()
+            self._text = self._clean_text(await self._get_text_from_scrape())
         return self._text
 
+    async def token_counts(self) -> dict:
+        await self.text()
+        return self._token_counts
+
     async def text_length(self):
         return len(await self.text())
 
-    @Logger(override_function_name="Generating Source Content Analysis")
-    async def _get_content_analysis_from_llm(self):
-        text = await self.text()
+    async def _analyse_chunk_with_llm(self, text: str):
         with open(str(Path(__file__).parent / "i18n/source_content.understand_content.yaml"), "r") as f:
             json_schema = yaml.safe_load(f)
         prompt = i18n(
@@ -71,7 +104,8 @@ class SourceContent(JSONCache):
                 further_information="",
                 markdown=text,
                 url=self.url)
-        llm = AsyncLLM(
+        response = await execute_llm(
+                stage="source_content.understand_content",
                 base=self.book_generator.settings.general_base,
                 model=self.book_generator.settings.general_model,
                 api_key=self.book_generator.settings.general_api_key,
@@ -81,11 +115,20 @@ class SourceContent(JSONCache):
                 max_output_tokens=50_000,
                 json_mode=True,
                 json_schema=json_schema)
-        await llm.execute()
-        llm.json_cache_save()
-        return llm.response
+        return response
+
+    @Logger(override_function_name="Generating Source Content Analysis")
+    async def _get_content_analysis_from_llm(self):
+        chunks = split_into_chunks(await self.text(), self.book_generator.settings.analysis_chunk_tokens)
+        if len(chunks) == 1:
+            return await self._analyse_chunk_with_llm(chunks[0])
+        Logger.note(f"{self}: analysing {len(chunks)} chunks concurrently")
+        analyses = await asyncio.gather(*[self._analyse_chunk_with_llm(chunk) for chunk in chunks])
+        return merge_content_analyses(analyses)
 
     async def content_analysis(self):
+        if self.duplicate_of is not None:
+            return {}
         if self._content_analysis is None:
             if await self.is_long_enough_for_analysis():
                 self._content_analysis = await self._get_content_analysis_from_llm()
@@ -122,7 +165,6 @@ class SourceContent(JSONCache):
         return result
 
     async def run_analysis(self):
-        if self._text is None:
-            self._text = await self._get_text_from_scrape()
-        if self._content_analysis is None and (await self.is_long_enough_for_analysis()) is True:
+        await self.text()
+        if self._content_analysis is None and self.duplicate_of is None and (await self.is_long_enough_for_analysis()) is True:
             self._content_analysis = await self._get_content_analysis_from_llm()
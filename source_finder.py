@@ -1,4 +1,6 @@
 import asyncio
+import math
+import random
 from pathlib import Path
 from trace import Trace
 from typing import List, TYPE_CHECKING
@@ -8,9 +10,16 @@ from cacherator import Cached, JSONCache
 from logorator import Logger
 from searcherator import Searcherator
 from slugify import slugify
-from smartllm import AsyncLLM
 from toml_i18n import i18n
 
+import concurrency
+import rate_limiter
+import token_budget
+from fingerprint import FingerprintIndex, minhash
+from helper import to_int
+from llm_runner import execute_llm
+from page_store import canonical_url
+from sheet_writer import sheet_writer
 from source_content import SourceContent
 
 if TYPE_CHECKING:
@@ -19,6 +28,9 @@ if TYPE_CHECKING:
 
 class SourceFinder(JSONCache):
     MIN_LENGTH_TO_BE_VIABLE = 2000  # chars
+    MIN_ANALYSED_SHARE_FOR_REFINEMENT = 0.8
+    SEARCH_MAX_RETRIES = 4
+    SEARCH_BACKOFF_BASE = 1.0  # seconds
 
     def __init__(self, bg: "BookGenerator") -> None:
         self.book_generator = bg
@@ -27,9 +39,12 @@ class SourceFinder(JSONCache):
         self._content = ""
         super().__init__(data_id=data_id, directory="data/source_finder", ttl=self.book_generator.ttl, clear_cache=self.book_generator.clear_cache)
         self._source_urls: list[str] = []
-        self._sources: list[SourceContent] = []
         self._refined_queries: list[str] = []
-        self._excluded_cache_vars = ["api_key"]
+        self._source_summary: list[dict] = []
+        self._analyses: dict[str, asyncio.Future] = {}
+        self._fingerprints = FingerprintIndex()
+        self._analysis_queue: asyncio.Queue | None = None
+        self._excluded_cache_vars = ["api_key", "_analyses", "_analysis_queue", "_fingerprints"]
 
     def __str__(self):
         return f"SourceFinder ({self.book_generator.settings.title})"
@@ -40,17 +55,17 @@ class SourceFinder(JSONCache):
     @property
     @Cached()
     def sources_tab(self):
-        return self.book_generator.sheet.tab(tab_name="Source URLs", data_format="list")
+        return sheet_writer.track(self.book_generator.sheet.tab(tab_name="Source URLs", data_format="list"))
 
     @property
     @Cached()
     def source_info_tab(self):
-        return self.book_generator.sheet.tab(tab_name="Source Information", data_format="dict")
+        return sheet_writer.track(self.book_generator.sheet.tab(tab_name="Source Information", data_format="dict"))
 
     @property
     @Cached()
     def refined_queries_tab(self):
-        return self.book_generator.sheet.tab(tab_name="Refined Queries", data_format="list")
+        return sheet_writer.track(self.book_generator.sheet.tab(tab_name="Refined Queries", data_format="list"))
 
     @Logger()
     def _load_source_urls_from_sheet(self):
@@ -66,7 +81,7 @@ class SourceFinder(JSONCache):
         tab.data = [["URL"]]
         for url in self._source_urls:
             tab.data.append([url])
-        tab.write_data(overwrite_tab=True)
+        sheet_writer.write(tab, overwrite_tab=True)
 
     @Logger()
     def _load_refined_queries_from_sheet(self):
@@ -82,20 +97,32 @@ class SourceFinder(JSONCache):
         tab.data = [["Refined Queries"]]
         for query in self._refined_queries:
             tab.data.append([query])
-        tab.write_data(overwrite_tab=True)
+        sheet_writer.write(tab, overwrite_tab=True)
 
     @Logger()
     async def _find_source_urls(self, prompt: str | None = None) -> List[str]:
         if prompt is None:
             prompt = i18n("source_finder.search", title=self.book_generator.settings.title, author=self.book_generator.settings.author)
-        search = Searcherator(
-            prompt,
-            num_results=self.book_generator.settings.urls_per_search,
-            language=self.book_generator.settings.language,
-            country=self.book_generator.settings.country,
-            api_key=self.book_generator.settings.DEFAULT_BRAVE_API_KEY,
-        )
-        result = await search.urls()
+        api_key = self.book_generator.settings.DEFAULT_BRAVE_API_KEY
+        bucket = rate_limiter.bucket_for(api_key, rate=self.book_generator.settings.search_requests_per_second)
+        for attempt in range(self.SEARCH_MAX_RETRIES + 1):
+            await bucket.acquire()
+            search = Searcherator(
+                prompt,
+                num_results=self.book_generator.settings.urls_per_search,
+                language=self.book_generator.settings.language,
+                country=self.book_generator.settings.country,
+                api_key=api_key,
+            )
+            try:
+                result = await search.urls()
+                break
+            except Exception as e:
+                if attempt == self.SEARCH_MAX_RETRIES or not rate_limiter.is_rate_limit_error(e):
+                    raise
+                delay = self.SEARCH_BACKOFF_BASE * 2 ** attempt + random.uniform(0, self.SEARCH_BACKOFF_BASE)
+                Logger.note(f"Search rate limited for '{prompt}', retrying in {delay:.1f}s")
+                bucket.pause(delay)
         Logger.note(f"Found information '{prompt}' with {len(result)} sources")
         return result
 
@@ -103,44 +130,50 @@ class SourceFinder(JSONCache):
     def source_urls(self):
         return self._source_urls
 
-    @property
-    @Cached(clear_cache=True)
-    def source_contents(self) -> list[SourceContent]:
-        result = []
+    def _register_sources(self) -> list[SourceContent]:
         if len(self.source_urls) == 0:
             self._source_urls = self._load_source_urls_from_sheet()
-        for url in self.source_urls:
-            sc = SourceContent(url=url, bg=self.book_generator)
-            result.append(sc)
-        return result
+        registry = self.book_generator.source_registry
+        return [registry.get_or_create(url) for url in self.source_urls]
+
+    @property
+    def source_contents(self) -> list[SourceContent]:
+        return self._register_sources()
+
+    def sources_for(self, urls: list[str]) -> list[SourceContent]:
+        if len(self.book_generator.source_registry) == 0:
+            self._register_sources()
+        return self.book_generator.source_registry.lookup(urls)
 
     async def source_summary(self):
-        result = []
-        for sc in self._sources:
-            if await sc.is_long_enough_for_analysis():
-                result += await sc.source_summary()
-        return result
+        return list(self._source_summary)
 
     @Logger()
     async def _save_source_summary_to_sheet(self):
         tab = self.source_info_tab
         tab.data = await self.source_summary()
         tab.data.sort(key=lambda x: x.get("coverage_rating"), reverse=True)
-        tab.write_data(overwrite_tab=True)
+        sheet_writer.write(tab, overwrite_tab=True)
 
-    @Logger()
-    async def find_more_search_queries_for_topic(self):
-        prompt = i18n(
+    def _search_queries_prompt(self, sources: list) -> str:
+        return i18n(
                 "source_finder.find_more_search_queries",
                 title=self.book_generator.settings.title,
                 author=self.book_generator.settings.author,
                 num_queries=self.book_generator.settings.num_search_refinements,
                 article_type=i18n(self.book_generator.settings.article_type_key),
-                sources=(await self.source_summary()))
+                sources=sources)
+
+    @Logger()
+    async def find_more_search_queries_for_topic(self):
+        sources = sorted(await self.source_summary(), key=lambda s: to_int(s.get("coverage_rating")), reverse=True)
+        budget = token_budget.remaining_tokens(self._search_queries_prompt(sources=[]))
+        prompt = self._search_queries_prompt(token_budget.fit_items(sources, budget))
         with open(str(Path(__file__).parent / "i18n/source_finder.find_more_search_queries.yaml"), "r") as f:
             schema = yaml.safe_load(f)
 
-        llm = AsyncLLM(
+        result = await execute_llm(
+                stage="source_finder.find_more_search_queries",
                 base=self.book_generator.settings.general_base,
                 model=self.book_generator.settings.general_model,
                 api_key=self.book_generator.settings.general_api_key,
@@ -149,30 +182,67 @@ class SourceFinder(JSONCache):
                 max_input_tokens=200_000,
                 max_output_tokens=50_000,
                 json_schema=schema)
-
-        result = await llm.execute()
         queries = [q.get("query") for q in result.get("queries")]
         return queries
 
-    @Logger()
-    async def _build_source_objects_from_urls(self):
-        used_urls = [s.url for s in self._sources]
-        for url in self._source_urls:
-            if url in used_urls:
-                continue
-            self._sources.append(SourceContent(url=url, bg=self.book_generator))
-            used_urls.append(url)
+    def _enqueue_urls(self, urls: list[str]) -> list[asyncio.Future]:
+        futures = []
+        for url in urls:
+            key = canonical_url(url)
+            if key not in self._analyses:
+                source = self.book_generator.source_registry.get_or_create(url)
+                self._analyses[key] = asyncio.get_running_loop().create_future()
+                self._analysis_queue.put_nowait(source)
+                self._source_urls.append(url)
+            futures.append(self._analyses[key])
+        return futures
+
+    async def _find_representative(self, source: SourceContent) -> str | None:
+        if not await source.is_long_enough_for_analysis():
+            return None
+        signature = await asyncio.to_thread(minhash, await source.text())
+        # only sources already analysed in this run are indexed, so no worker ever waits on another
+        matches = [url for url, _ in self._fingerprints.find(signature) if url != source.url]
+        if not matches:
+            self._fingerprints.add(source.url, signature)
+            return None
+        Logger.note(f"{source} is a near-duplicate of {matches[0]}")
+        return matches[0]
+
+    async def _analysis_worker(self):
+        while True:
+            source = await self._analysis_queue.get()
+            future = self._analyses[canonical_url(source.url)]
+            try:
+                source.duplicate_of = await self._find_representative(source)
+                source.json_cache_save()
+                if source.duplicate_of is None:
+                    await source.run_analysis()
+                    if await source.is_long_enough_for_analysis():
+                        self._source_summary += await source.source_summary()
+                future.set_result(source)
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                self._analysis_queue.task_done()
 
     @Logger()
-    async def _analyse_all_sources(self):
-        semaphore = asyncio.Semaphore(40)
-
-        async def sem_task(source):
-            async with semaphore:
-                return await source.run_analysis()
-
-        tasks = [sem_task(s) for s in self._sources]
-        await asyncio.gather(*tasks)
+    async def _wait_for_analysed_share(self, futures: list[asyncio.Future], share: float):
+        needed = math.ceil(len(futures) * share)
+        if needed == 0:
+            return
+        for done, future in enumerate(asyncio.as_completed(futures), start=1):
+            await future
+            if done >= needed:
+                return
+
+    async def _refine_queries(self, initial_analyses: list[asyncio.Future]):
+        if not self.book_generator.clear_cache:
+            self._refined_queries = self._load_refined_queries_from_sheet()
+        if len(self._refined_queries) < self.book_generator.settings.num_search_refinements:
+            await self._wait_for_analysed_share(initial_analyses, self.MIN_ANALYSED_SHARE_FOR_REFINEMENT)
+            self._refined_queries = list(dict.fromkeys(self._refined_queries + await self.find_more_search_queries_for_topic()))
+            self._save_refined_queries_to_sheet()
 
     async def run(self):
         self._source_urls = []
@@ -182,21 +252,25 @@ class SourceFinder(JSONCache):
             self._source_urls = await self._find_source_urls()
             self._save_source_urls_to_sheet()
 
-        self._sources = []
-        await self._build_source_objects_from_urls()
-        await self._analyse_all_sources()
+        self._source_summary = []
+        self._analyses = {}
+        self._fingerprints = FingerprintIndex()
+        self._analysis_queue = asyncio.Queue()
+        workers = [asyncio.create_task(self._analysis_worker()) for _ in range(concurrency.limiter.maximum("scraping"))]
+        try:
+            initial_urls, self._source_urls = self._source_urls, []
+            initial_analyses = self._enqueue_urls(initial_urls)
+            await self._refine_queries(initial_analyses)
 
-        if not self.book_generator.clear_cache:
-            self._refined_queries = self._load_refined_queries_from_sheet()
-        if len(self._refined_queries) < self.book_generator.settings.num_search_refinements:
-            self._refined_queries = list(dict.fromkeys(self._refined_queries + await self.find_more_search_queries_for_topic()))
-            self._save_refined_queries_to_sheet()
+            async def search_and_enqueue(query):
+                self._enqueue_urls(await self._find_source_urls(query))
 
-        for query in self._refined_queries:
-            refined_urls = await self._find_source_urls(query)
-            self._source_urls = list(dict.fromkeys(self._source_urls + refined_urls))
-        self._save_source_urls_to_sheet()
+            await asyncio.gather(*[search_and_enqueue(query) for query in self._refined_queries])
+            self._save_source_urls_to_sheet()
 
-        await self._build_source_objects_from_urls()
-        await self._analyse_all_sources()
+            await self._analysis_queue.join()
+            await asyncio.gather(*self._analyses.values())
+        finally:
+            for worker in workers:
+                worker.cancel()
         await self._save_source_summary_to_sheet()
@@ -0,0 +1,46 @@
+from typing import TYPE_CHECKING, Iterator
+
+from page_store import canonical_url
+from source_content import SourceContent
+
+if TYPE_CHECKING:
+    from book_generator import BookGenerator
+
+
+class SourceRegistry:
+
+    def __init__(self, bg: "BookGenerator"):
+        self.book_generator = bg
+        self._sources: dict[str, SourceContent] = {}
+
+    def __str__(self):
+        return f"SourceRegistry ({self.book_generator.settings.title}, {len(self)} sources)"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __len__(self):
+        return len(self._sources)
+
+    def __contains__(self, url: str):
+        return canonical_url(url) in self._sources
+
+    def __iter__(self) -> Iterator[SourceContent]:
+        return iter(self._sources.values())
+
+    def get(self, url: str) -> SourceContent | None:
+        return self._sources.get(canonical_url(url))
+
+    def get_or_create(self, url: str) -> SourceContent:
+        key = canonical_url(url)
+        if key not in self._sources:
+            self._sources[key] = SourceContent(url=url, bg=self.book_generator)
+        return self._sources[key]
+
+    def lookup(self, urls: list[str]) -> list[SourceContent]:
+        result = []
+        for url in urls:
+            source = self.get(url)
+            if source is not None and source not in result:
+                result.append(source)
+        return result
@@ -0,0 +1,97 @@
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+from logorator import Logger
+
+
+class Stage:
+
+    def __init__(self, name: str, action: Callable[[], Awaitable], depends_on: list[str] | None = None):
+        self.name = name
+        self.action = action
+        self.depends_on = depends_on or []
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+
+    def __str__(self):
+        return f"Stage {self.name}"
+
+    def __repr__(self):
+        return self.__str__()
+
+    @property
+    def duration(self) -> float:
+        if self.started_at is None or self.finished_at is None:
+            return 0.0
+        return self.finished_at - self.started_at
+
+
+class StageScheduler:
+
+    def __init__(self, name: str = "", after_stage: Callable[[], Awaitable] | None = None):
+        self.name = name
+        self.after_stage = after_stage
+        self.stages: dict[str, Stage] = {}
+
+    def __str__(self):
+        return f"StageScheduler ({self.name})"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def add(self, name: str, action: Callable[[], Awaitable], depends_on: list[str] | None = None) -> Stage:
+        if name in self.stages:
+            raise ValueError(f"Stage '{name}' is already defined")
+        stage = Stage(name=name, action=action, depends_on=depends_on)
+        self.stages[name] = stage
+        return stage
+
+    def _topological_order(self) -> list[Stage]:
+        for stage in self.stages.values():
+            for dependency in stage.depends_on:
+                if dependency not in self.stages:
+                    raise ValueError(f"{stage} depends on unknown stage '{dependency}'")
+        result = []
+        visited: dict[str, bool] = {}
+
+        def visit(stage: Stage):
+            if visited.get(stage.name) is True:
+                return
+            if visited.get(stage.name) is False:
+                raise ValueError(f"Cyclic stage dependency at '{stage.name}'")
+            visited[stage.name] = False
+            for dependency in stage.depends_on:
+                visit(self.stages[dependency])
+            visited[stage.name] = True
+            result.append(stage)
+
+        for stage in self.stages.values():
+            visit(stage)
+        return result
+
+    async def _run_stage(self, stage: Stage, tasks: dict[str, asyncio.Task]):
+        if stage.depends_on:
+            await asyncio.gather(*[tasks[dependency] for dependency in stage.depends_on])
+        Logger.note(f"{self}: starting {stage}")
+        stage.started_at = time.monotonic()
+        result = await stage.action()
+        if self.after_stage is not None:
+            await self.after_stage()
+        stage.finished_at = time.monotonic()
+        Logger.note(f"{self}: finished {stage} in {stage.duration:.1f}s")
+        return result
+
+    @Logger()
+    async def run(self) -> dict:
+        tasks: dict[str, asyncio.Task] = {}
+        for stage in self._topological_order():
+            tasks[stage.name] = asyncio.create_task(self._run_stage(stage, tasks), name=stage.name)
+        try:
+            await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        return {name: task.result() for name, task in tasks.items()}
@@ -0,0 +1,204 @@
+import atexit
+import gzip
+import json
+import os
+import sqlite3
+import time
+import zlib
+from pathlib import Path
+from typing import Iterator
+
+DEFAULT_BACKEND = os.environ.get("BOOKGEN_STORAGE_BACKEND", "sqlite")
+
+
+def _encode(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+class FileStorage:
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self._size: int | None = None
+
+    def __str__(self):
+        return f"FileStorage ({self.directory})"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def _path(self, key: str) -> Path:
+        *prefix, name = key.split("/")
+        return self.directory.joinpath(*prefix, name[:2], f"{name}.json.gz")
+
+    def _files(self) -> list[Path]:
+        if not self.directory.exists():
+            return []
+        return list(self.directory.rglob("*.json.gz"))
+
+    def _key(self, path: Path) -> str:
+        *prefix, _, file_name = path.relative_to(self.directory).parts
+        return "/".join([*prefix, file_name.removesuffix(".json.gz")])
+
+    def get(self, key: str):
+        try:
+            with gzip.open(self._path(key), "rb") as f:
+                return json.loads(f.read())
+        except (FileNotFoundError, OSError, json.JSONDecodeError):
+            return None
+
+    def set(self, key: str, value):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        previous_size = path.stat().st_size if path.exists() else 0
+        temporary_path = path.with_name(f"{path.name}.tmp")
+        with gzip.open(temporary_path, "wb") as f:
+            f.write(_encode(value))
+        temporary_path.replace(path)
+        if self._size is not None:
+            self._size += path.stat().st_size - previous_size
+
+    def delete(self, key: str):
+        path = self._path(key)
+        try:
+            size = path.stat().st_size
+            path.unlink()
+        except FileNotFoundError:
+            return
+        if self._size is not None:
+            self._size -= size
+
+    def touch(self, key: str):
+        try:
+            os.utime(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def entries(self) -> Iterator[tuple[str, int, float]]:
+        # (key, size, last access), least recently used first
+        stats = [(path, path.stat()) for path in self._files()]
+        for path, stat in sorted(stats, key=lambda item: item[1].st_mtime):
+            yield self._key(path), stat.st_size, stat.st_mtime
+
+    def size(self) -> int:
+        if self._size is None:
+            self._size = sum(path.stat().st_size for path in self._files())
+        return self._size
+
+    def flush(self):
+        pass
+
+
+class SQLiteStorage:
+    DATABASE_NAME = "storage.sqlite"
+    BATCH_SIZE = 50  # writes and access times per transaction
+    FLUSH_INTERVAL = 5.0  # seconds
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path = self.directory / self.DATABASE_NAME
+        # writes are queued and committed together in one short transaction, so no lock is held between batches
+        self._connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                accessed_at REAL NOT NULL)""")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+        self._writes: dict[str, tuple[bytes, float] | None] = {}  # None marks a delete
+        self._accessed: dict[str, float] = {}
+        self._last_flush = time.monotonic()
+        self._size: int | None = None
+        atexit.register(self.flush)
+
+    def __str__(self):
+        return f"SQLiteStorage ({self.path})"
+
+    def __repr__(self):
+        return self.__str__()
+
+    def _stored_size(self, key: str) -> int:
+        if key in self._writes:
+            write = self._writes[key]
+            return len(write[0]) if write else 0
+        row = self._connection.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def get(self, key: str):
+        if key in self._writes:
+            write = self._writes[key]
+            return json.loads(zlib.decompress(write[0])) if write else None
+        row = self._connection.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(zlib.decompress(row[0]))
+
+    def _flush_if_due(self):
+        if len(self._writes) + len(self._accessed) >= self.BATCH_SIZE or time.monotonic() - self._last_flush > self.FLUSH_INTERVAL:
+            self.flush()
+
+    def set(self, key: str, value):
+        blob = zlib.compress(_encode(value))
+        previous_size = self._stored_size(key) if self._size is not None else 0
+        self._writes[key] = (blob, time.time())
+        self._accessed.pop(key, None)
+        if self._size is not None:
+            self._size += len(blob) - previous_size
+        self._flush_if_due()
+
+    def delete(self, key: str):
+        size = self._stored_size(key) if self._size is not None else 0
+        self._writes[key] = None
+        self._accessed.pop(key, None)
+        if self._size is not None:
+            self._size -= size
+        self._flush_if_due()
+
+    def touch(self, key: str):
+        self._accessed[key] = time.time()
+        self._flush_if_due()
+
+    def entries(self) -> Iterator[tuple[str, int, float]]:
+        # (key, size, last access), least recently used first
+        self.flush()
+        yield from self._connection.execute("SELECT key, size, accessed_at FROM entries ORDER BY accessed_at").fetchall()
+
+    def size(self) -> int:
+        # counted once, then kept up to date by this process's writes
+        if self._size is None:
+            self.flush()
+            self._size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        return self._size
+
+    def flush(self):
+        writes, self._writes = self._writes, {}
+        accessed, self._accessed = self._accessed, {}
+        self._last_flush = time.monotonic()
+        if not writes and not accessed:
+            return
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._connection.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, write in writes.items() if write is None])
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, size, updated_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                [(key, write[0], len(write[0]), write[1], write[1]) for key, write in writes.items() if write])
+            self._connection.executemany("UPDATE entries SET accessed_at = ? WHERE key = ?",
+                                         [(accessed_at, key) for key, accessed_at in accessed.items()])
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            self._writes = {**writes, **self._writes}
+            raise
+        self._connection.execute("COMMIT")
+
+
+def open_storage(directory: str, backend: str = DEFAULT_BACKEND):
+    if backend == "sqlite":
+        return SQLiteStorage(directory)
+    if backend == "files":
+        return FileStorage(directory)
+    raise ValueError(f"Unknown storage backend '{backend}'")
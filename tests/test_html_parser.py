@@ -0,0 +1,31 @@
+from pathlib import Path
+
+import pytest
+
+import html_parser
+from html_parser import Target
+
+FIXTURES = Path(__file__).parent / "fixtures"
+PAGE_TARGETS = [Target("script"), Target("h1"), Target("adbl-text-block", slot="summary"), Target("div", class_="bc-tab-content")]
+
+
+@pytest.mark.parametrize("backend", html_parser.AVAILABLE_BACKENDS)
+def test_search_results_with_several_classes_are_kept(backend):
+    html = (FIXTURES / "audible_search.html").read_text(encoding="utf-8")
+    soup = html_parser.parse(html, targets=[Target(class_="productListItem")], backend=backend)
+    items = soup.find_all(class_="productListItem")
+    assert [item["id"] for item in items] == ["product-list-item-B002V1OF70", "product-list-item-B002V1BWJQ"]
+    assert items[0].find("a")["href"].startswith("/pd/Dune-Audiobook/B002V1OF70")
+    assert soup.find("footer") is None
+
+
+@pytest.mark.parametrize("backend", html_parser.AVAILABLE_BACKENDS)
+def test_product_page_targets(backend):
+    html = (FIXTURES / "audible_page.html").read_text(encoding="utf-8")
+    soup = html_parser.parse(html, targets=PAGE_TARGETS, backend=backend)
+    assert soup.find("h1").get_text() == "Dune"
+    assert soup.find("adbl-text-block", {"slot": "summary"}).get_text() == "Set on the desert planet Arrakis."
+    assert soup.find("div", {"class": "bc-tab-content"}).find("h3").get_text() == "A classic"
+    assert "Frank Herbert" in soup.find("script").string
+    assert soup.find("nav") is None
+    assert soup.find(string="not a target") is None
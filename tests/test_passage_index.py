@@ -0,0 +1,18 @@
+from passage_index import PassageIndex
+
+PASSAGES = [
+    ("https://a.example", "The mouse asks for a glass of milk to go with the cookie."),
+    ("https://a.example", "The boy sweeps the floor and takes a nap."),
+    ("https://b.example", "Laura Numeroff wrote the book in 1985."),
+]
+
+
+def test_search_ranks_matching_passages():
+    index = PassageIndex(PASSAGES)
+    assert index.search("milk cookie", k=2) == [PASSAGES[0][1]]
+
+
+def test_search_without_matching_terms_returns_nothing():
+    index = PassageIndex(PASSAGES)
+    assert index.search("submarine warfare", k=3) == []
+    assert index.search("submarine warfare", k=3, url="https://a.example") == []
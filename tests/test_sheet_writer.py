@@ -0,0 +1,55 @@
+from sheet_writer import SheetWriter, changed_ranges
+
+
+class FakeWorksheet:
+
+    def __init__(self):
+        self.batches = []
+
+    def batch_update(self, ranges, value_input_option="RAW"):
+        self.batches.append(ranges)
+
+
+class FakeTab:
+
+    def __init__(self, values):
+        self._data_as_list = values
+        self._worksheet = FakeWorksheet()
+        self.full_writes = 0
+
+    def write_data(self, **kwargs):
+        self.full_writes += 1
+
+
+def test_changed_ranges_groups_runs_of_changed_cells():
+    before = [["ASIN", "Title", "Done"], ["A1", "Dune", 0], ["A2", "Emma", 0]]
+    after = [["ASIN", "Title", "Done"], ["A1", "Dune", 1], ["A2", "Persuasion", 1]]
+    assert changed_ranges(before, after) == [
+        {"range": "C2:C2", "values": [[1]]},
+        {"range": "B3:C3", "values": [["Persuasion", 1]]}]
+
+
+def test_changed_ranges_clears_cells_that_disappeared():
+    assert changed_ranges([["a", "b"], ["c", "d"]], [["a", "b"]]) == [{"range": "A2:B2", "values": [["", ""]]}]
+
+
+def test_changed_ranges_beyond_column_z():
+    assert changed_ranges([[""] * 28], [[""] * 27 + ["x"]]) == [{"range": "AB1:AB1", "values": [["x"]]}]
+
+
+def test_tracked_tab_sends_only_changed_cells_in_one_batch():
+    writer = SheetWriter()
+    tab = writer.track(FakeTab([["Key", "Value"], ["title", "Dune"], ["author", None]]))
+    tab._data_as_list = [["Key", "Value"], ["title", "Dune"], ["author", "Herbert"]]
+    writer.write(tab)
+    assert tab.full_writes == 0
+    assert tab._worksheet.batches == [[{"range": "B3:B3", "values": [["Herbert"]]}]]
+    writer.write(tab)
+    assert len(tab._worksheet.batches) == 1
+
+
+def test_untracked_tab_is_written_in_full():
+    writer = SheetWriter()
+    tab = FakeTab([["Key", "Value"]])
+    writer.write(tab, overwrite_tab=True)
+    assert tab.full_writes == 1
@@ -0,0 +1,19 @@
+from text_cleaner import clean_text
+
+
+def test_cookie_themed_article_survives():
+    article = "\n\n".join([
+        "If You Give a Mouse a Cookie is a picture book by Laura Numeroff.",
+        "The mouse asks for a glass of milk to go with the cookie.",
+        "Each request leads to another, until the mouse wants a cookie again.",
+        "Grandma's cookies are the best cookies in the whole book."])
+    assert clean_text(article) == article
+
+
+def test_cookie_banner_is_removed():
+    text = "\n\n".join([
+        "We use cookies to improve your experience. By continuing you accept our privacy policy.",
+        "Accept all",
+        "Wir verwenden Cookies. Bitte stimmen Sie der Datenschutzerklärung zu.",
+        "The mouse asks for a glass of milk to go with the cookie."])
+    assert clean_text(text) == "The mouse asks for a glass of milk to go with the cookie."
@@ -0,0 +1,89 @@
+import re
+from collections import Counter
+
+COOKIE_PATTERN = re.compile(r"\b(cookies?|cookie-\w+)\b", re.IGNORECASE)
+CONSENT_PATTERN = re.compile(
+    r"\b(accept\w*|reject\w*|consent\w*|agree\w*|opt[ -]out|privacy (policy|settings|preferences)|"
+    r"akzeptier\w*|ablehn\w*|zustimm\w*|einwillig\w*|datenschutz\w*)\b",
+    re.IGNORECASE)
+CONSENT_BUTTON_PATTERN = re.compile(
+    r"\b(accept all|reject all|manage preferences|datenschutzeinstellungen|alle akzeptieren|alle ablehnen)\b",
+    re.IGNORECASE)
+NAVIGATION_PATTERN = re.compile(
+    r"^(skip to (main )?content|menu|main menu|navigation|home|search|sign in|log ?in|sign up|register|subscribe|"
+    r"newsletter|share( on \w+)?|tweet|pin it|print|email|back to top|next|previous|read more|weiterlesen|"
+    r"zum inhalt springen|anmelden|registrieren|suche|teilen|startseite|mehr lesen)\W*$",
+    re.IGNORECASE)
+MARKDOWN_LINK_PATTERN = re.compile(r"!?\[[^\]]*\]\([^)]*\)")
+MENU_SEPARATOR_PATTERN = re.compile(r"\s[|•·»/]\s")
+COMMENT_SECTION_PATTERN = re.compile(
+    r"^\W*(\d+\s+)?(comments?|responses?|replies|leave a (comment|reply)|join the discussion|"
+    r"kommentare?|antworten|kommentar schreiben)\W*(\(\d+\))?\W*$",
+    re.IGNORECASE)
+
+MAX_BOILERPLATE_WORDS = 40
+MAX_NAVIGATION_WORDS = 12
+REPEATED_LINE_THRESHOLD = 3
+MIN_SHARE_BEFORE_COMMENTS = 0.3
+
+
+def _normalize(line: str) -> str:
+    return re.sub(r"\s+", " ", line).strip().casefold()
+
+
+def _is_navigation(line: str) -> bool:
+    stripped = line.strip().strip("*#->").strip()
+    if NAVIGATION_PATTERN.match(stripped):
+        return True
+    without_links = MARKDOWN_LINK_PATTERN.sub("", stripped).strip(" |•·»-/")
+    if stripped and not without_links:
+        return True
+    if line.lstrip().startswith("|"):
+        return False  # markdown table row
+    words = stripped.split()
+    return len(words) <= MAX_NAVIGATION_WORDS and len(MENU_SEPARATOR_PATTERN.findall(stripped)) >= 2
+
+
+def _is_cookie_banner(line: str) -> bool:
+    # "cookie" on its own is ordinary prose; a banner pairs it with consent wording
+    if len(line.split()) > MAX_BOILERPLATE_WORDS:
+        return False
+    if CONSENT_BUTTON_PATTERN.search(line):
+        return True
+    return COOKIE_PATTERN.search(line) is not None and CONSENT_PATTERN.search(line) is not None
+
+
+def _cut_comment_thread(lines: list[str]) -> list[str]:
+    total = sum(len(line) for line in lines) or 1
+    seen = 0
+    for index, line in enumerate(lines):
+        if seen / total >= MIN_SHARE_BEFORE_COMMENTS and COMMENT_SECTION_PATTERN.match(line.strip()):
+            return lines[:index]
+        seen += len(line)
+    return lines
+
+
+def clean_text(text: str) -> str:
+    if not text:
+        return ""
+    lines = _cut_comment_thread(text.splitlines())
+
+    counts = Counter(_normalize(line) for line in lines if line.strip())
+    repeated = {line for line, count in counts.items() if count >= REPEATED_LINE_THRESHOLD and len(line.split()) <= MAX_BOILERPLATE_WORDS}
+
+    kept = []
+    for line in lines:
+        if line.strip() and (_normalize(line) in repeated or _is_navigation(line) or _is_cookie_banner(line)):
+            continue
+        kept.append(line)
+
+    paragraphs = re.split(r"\n\s*\n", "\n".join(kept))
+    seen_paragraphs = set()
+    result = []
+    for paragraph in paragraphs:
+        key = _normalize(paragraph)
+        if not key or key in seen_paragraphs:
+            continue
+        seen_paragraphs.add(key)
+        result.append(paragraph.strip("\n"))
+    return "\n\n".join(result)
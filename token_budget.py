@@ -0,0 +1,60 @@
+import re
+
+from logorator import Logger
+
+from helper import estimate_tokens
+
+DEFAULT_MAX_INPUT_TOKENS = 200_000
+SAFETY_MARGIN = 0.05  # share of the limit kept free for estimation error
+MIN_TRUNCATED_TOKENS = 500  # don't bother adding a truncated item smaller than this
+
+
+class PromptTooLargeError(ValueError):
+    pass
+
+
+def usable_tokens(max_input_tokens: int = DEFAULT_MAX_INPUT_TOKENS) -> int:
+    return int(max_input_tokens * (1 - SAFETY_MARGIN))
+
+
+def remaining_tokens(prompt_without_content: str, max_input_tokens: int = DEFAULT_MAX_INPUT_TOKENS) -> int:
+    return max(0, usable_tokens(max_input_tokens) - estimate_tokens(prompt_without_content))
+
+
+def truncate_text(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    max_chars = max(0, max_tokens * 4)
+    cut = text[:max_chars]
+    for pattern in (r"\n\s*\n", r"\n", r"(?<=[.!?])\s", r"\s"):
+        boundaries = [m.start() for m in re.finditer(pattern, cut)]
+        if boundaries and boundaries[-1] > max_chars // 2:
+            return cut[:boundaries[-1]].rstrip()
+    return cut
+
+
+def fit_items(items: list, max_tokens: int, text_key: str | None = None) -> list:
+    # keeps items in the given order; the first item that doesn't fit is truncated on text_key if there is room left
+    result = []
+    used = 0
+    for item in items:
+        size = estimate_tokens(item)
+        if used + size <= max_tokens:
+            result.append(item)
+            used += size
+            continue
+        room = max_tokens - used - (size - estimate_tokens(item.get(text_key, ""))) if text_key and isinstance(item, dict) else 0
+        if room >= MIN_TRUNCATED_TOKENS:
+            result.append({**item, text_key: truncate_text(item[text_key], room)})
+        break
+    if len(result) < len(items):
+        Logger.note(f"Token budget: kept {len(result)} of {len(items)} items within {max_tokens} tokens")
+    return result
+
+
+def check_prompt(prompt: str, max_input_tokens: int = DEFAULT_MAX_INPUT_TOKENS, stage: str = "") -> int:
+    tokens = estimate_tokens(prompt)
+    Logger.note(f"{stage or 'LLM'}: ~{tokens} prompt tokens (limit {max_input_tokens})")
+    if tokens > usable_tokens(max_input_tokens):
+        raise PromptTooLargeError(f"{stage or 'LLM'} prompt has ~{tokens} tokens, limit is {max_input_tokens}")
+    return tokens
@@ -1,11 +1,14 @@
 from typing import TYPE_CHECKING
 
-from docorator import Docorator
 from logorator import Logger
 from slugify import slugify
-from smartllm import AsyncLLM
 from toml_i18n import i18n
 
+import document_backend
+import token_budget
+from helper import to_int
+from llm_runner import execute_llm
+
 if TYPE_CHECKING:
     from book_generator import BookGenerator
     from source_content import SourceContent
@@ -19,7 +22,6 @@ class Topic(JSONCache):
         self.book_generator = bg
         if topic_information is None:
             topic_information = {}
-        self._source_information: list = []
 
         JSONCache.__init__(
                 self,
@@ -30,6 +32,8 @@ class Topic(JSONCache):
         self._draft: str = ""
         self._refined_text: str = ""
         self._sources = []
+        # passages are retrieved fresh each run; older caches hold full source texts here
+        self._source_information: list = []
 
         self.information = topic_information
         self.name = self.information.get("topic_name", "")
@@ -38,17 +42,16 @@ class Topic(JSONCache):
         self.suggested_length = self.information.get("word_count", 0)
         self.source_urls = [s.strip() for s in self.information.get("sources", "").split(",")]
 
-        self.google_doc_topic_draft = Docorator(
-                service_account_file=self.book_generator.settings.service_account_file,
-                document_name=f"Topic {slugify(self.name)} ({slugify(self.book_generator.settings.title)})",
-                clear_cache=self.book_generator.clear_cache)
+        self.google_doc_topic_draft = document_backend.open_document(
+                self.book_generator,
+                document_name=f"Topic {slugify(self.name)} ({slugify(self.book_generator.settings.title)})")
 
-        self.google_doc_refined_topic_text = Docorator(
-                service_account_file=self.book_generator.settings.service_account_file,
-                document_name=f"Refined Topic {slugify(self.name)} ({slugify(self.book_generator.settings.title)})",
-                clear_cache=self.book_generator.clear_cache)
+        self.google_doc_refined_topic_text = document_backend.open_document(
+                self.book_generator,
+                document_name=f"Refined Topic {slugify(self.name)} ({slugify(self.book_generator.settings.title)})")
 
         self._google_docs_initialized = False
+        self._excluded_cache_vars = ["_source_information"]
 
     def __str__(self):
         return f"Topic {self.name}"
@@ -58,7 +61,7 @@ class Topic(JSONCache):
 
     async def initialize(self):
         if not self._google_docs_initialized:
-            Logger.note(f"Initializing Google Docs for Topic {self.name}")
+            Logger.note(f"Initializing Documents for Topic {self.name}")
             await self.google_doc_topic_draft.initialize()
             await self.google_doc_refined_topic_text.initialize()
             if not self.book_generator.clear_cache:
@@ -69,27 +72,32 @@ class Topic(JSONCache):
     @property
     def sources(self) -> list["SourceContent"]:
         if len(self._sources) == 0:
-            self._sources = []
-            for s in self.book_generator.sources:
-                source_urls = self.source_urls
-                if s.url in source_urls:
-                    self._sources.append(s)
+            self._sources = self.book_generator.source_finder.sources_for(self.source_urls)
         return self._sources
 
+    @staticmethod
+    async def _coverage_rating(source: "SourceContent") -> int:
+        content_analysis = await source.content_analysis()
+        return max((to_int(item.get("coverage_rating")) for item in content_analysis.get("content_analysis", [])), default=0)
+
     async def source_information(self):
         if len(self._source_information) == 0:
             self._source_information = []
-            for source in self.sources:
-                row = {"url": source.url, "text": await source.text()}
-                self._source_information.append(row)
+            ratings = {source.url: await self._coverage_rating(source) for source in self.sources}
+            index = await self.book_generator.passage_index()
+            query = f"{self.name} {self.details}"
+            for source in sorted(self.sources, key=lambda s: ratings[s.url], reverse=True):
+                passages = index.search(query, k=self.book_generator.settings.passages_per_source, url=source.url)
+                if passages:
+                    self._source_information.append({"url": source.url, "text": "\n\n[...]\n\n".join(passages)})
         return self._source_information
 
-    @Logger(override_function_name="Loading Draft from Google Doc")
+    @Logger(override_function_name="Loading Draft from Document")
     async def _get_draft_from_google_doc(self):
         self._draft = await self.google_doc_topic_draft.export_as_markdown()
         return self._draft
 
-    @Logger(override_function_name="Loading Refined Text from Google Doc")
+    @Logger(override_function_name="Loading Refined Text from Document")
     async def _get_refined_text_from_google_doc(self):
         self._refined_text = await self.google_doc_refined_topic_text.export_as_markdown()
         return self._refined_text
@@ -119,22 +127,26 @@ class Topic(JSONCache):
     async def refined_text_word_count(self) -> int:
         return len(self._refined_text.split())
 
-    async def _write_draft_with_llm(self):
-        source_information = await self.source_information()
-        article_structure = self.book_generator.article_writer.article_structure
-        word_count = self.suggested_length
-        prompt = i18n(
+    def _draft_prompt(self, source_information: list) -> str:
+        return i18n(
                 "topic.write_draft",
                 title=self.book_generator.settings.title,
                 author=self.book_generator.settings.author,
                 source_information=source_information,
-                article_structure=article_structure,
-                word_count=word_count,
+                article_structure=self.book_generator.article_writer.article_structure,
+                word_count=self.suggested_length,
                 details=self.details,
                 topic=self.name,
                 article_type=i18n(self.book_generator.settings.article_type_key),
                 language=i18n("style.language"), )
-        llm = AsyncLLM(
+
+    async def _write_draft_with_llm(self):
+        budget = token_budget.remaining_tokens(self._draft_prompt(source_information=[]))
+        source_information = token_budget.fit_items(await self.source_information(), budget, text_key="text")
+        prompt = self._draft_prompt(source_information)
+        response = await execute_llm(
+                pool="writing_llm",
+                stage="topic.write_draft",
                 base=self.book_generator.settings.writing_base,
                 model=self.book_generator.settings.writing_model,
                 api_key=self.book_generator.settings.writing_api_key,
@@ -143,24 +155,31 @@ class Topic(JSONCache):
                 max_input_tokens=200_000,
                 max_output_tokens=50_000,
                 stream=True)
-        await llm.execute()
-        self._draft = llm.response
+        self._draft = response
         self.json_cache_save()
         return self._draft
 
-    async def _refine_topic_with_llm(self):
-        article = await self.book_generator.article_writer.full_article_draft()
-
-        prompt = i18n(
-                "topic.refine_text",
+    def _refine_prompt(self, article: list, prompt_key: str = "topic.refine_text") -> str:
+        return i18n(
+                prompt_key,
                 title=self.book_generator.settings.title,
                 author=self.book_generator.settings.author,
                 section_number=self.order,
                 article=article,
                 section=self._draft,
                 article_type=i18n(self.book_generator.settings.article_type_key),
-                topic=self.name)
-        llm = AsyncLLM(
+                topic=self.name,
+                language=i18n("style.language"))
+
+    async def _article_context_for(self, prompt_key: str) -> list:
+        article = await self.book_generator.article_writer.article_context()
+        return token_budget.fit_items(article, token_budget.remaining_tokens(self._refine_prompt(article=[], prompt_key=prompt_key)))
+
+    async def _execute_writing_llm(self, prompt: str, stage: str, use_cache: bool = True) -> str:
+        return await execute_llm(
+                pool="writing_llm",
+                stage=stage,
+                use_cache=use_cache,
                 base=self.book_generator.settings.writing_base,
                 model=self.book_generator.settings.writing_model,
                 api_key=self.book_generator.settings.writing_api_key,
@@ -169,33 +188,31 @@ class Topic(JSONCache):
                 max_input_tokens=200_000,
                 max_output_tokens=50_000,
                 stream=True)
-        await llm.execute()
-        self._refined_text = llm.response
-        self.json_cache_save()
+
+    async def _refine_in_two_passes(self, use_cache: bool = True) -> str:
+        prompt = self._refine_prompt(await self._article_context_for("topic.refine_text"))
+        refined_text = await self._execute_writing_llm(prompt, stage="topic.refine_text", use_cache=use_cache)
 
         prompt_language = i18n(
                 "topic.refine_language",
                 title=self.book_generator.settings.title,
                 author=self.book_generator.settings.author,
                 topic=self.name,
-                section=self._refined_text,
+                section=refined_text,
                 article_type=i18n(self.book_generator.settings.article_type_key),
                 language=i18n("style.language"))
+        return await self._execute_writing_llm(prompt_language, stage="topic.refine_language", use_cache=use_cache)
 
-        llm_language = AsyncLLM(
-                base=self.book_generator.settings.writing_base,
-                model=self.book_generator.settings.writing_model,
-                api_key=self.book_generator.settings.writing_api_key,
-                prompt=prompt_language,
-                temperature=0.2,
-                max_input_tokens=200_000,
-                max_output_tokens=50_000,
-                stream=True)
-        await llm_language.execute()
+    async def _refine_in_one_pass(self, use_cache: bool = True) -> str:
+        prompt = self._refine_prompt(await self._article_context_for("topic.refine_combined"), prompt_key="topic.refine_combined")
+        return await self._execute_writing_llm(prompt, stage="topic.refine_combined", use_cache=use_cache)
 
-        self._refined_text = llm_language.response
+    async def _refine_topic_with_llm(self):
+        if self.book_generator.settings.refinement_mode == "combined":
+            self._refined_text = await self._refine_in_one_pass()
+        else:
+            self._refined_text = await self._refine_in_two_passes()
         self.json_cache_save()
-
         return self._refined_text
 
     async def write_draft_with_llm_and_save_to_google_doc(self):
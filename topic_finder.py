@@ -5,9 +5,11 @@ import yaml
 from cacherator import Cached, JSONCache
 from logorator import Logger
 from slugify import slugify
-from smartllm import AsyncLLM
 from toml_i18n import i18n
 
+import token_budget
+from sheet_writer import sheet_writer
+from llm_runner import execute_llm
 from topic import Topic
 
 if TYPE_CHECKING:
@@ -39,7 +41,7 @@ class TopicFinder(JSONCache):
     @property
     @Cached()
     def topic_information_tab(self):
-        return self.book_generator.sheet.tab(tab_name="Topic Information", data_format="dict")
+        return sheet_writer.track(self.book_generator.sheet.tab(tab_name="Topic Information", data_format="dict"))
 
     def _load_source_summary_from_sheet(self):
         self._source_summary = self.source_info_tab.data
@@ -65,15 +67,20 @@ class TopicFinder(JSONCache):
         else:
             prompt_key = "topic_finder.synthesize_sources_for_short_article"
 
-        prompt = i18n(
-                prompt_key,
-                title=self.book_generator.settings.title,
-                author=self.book_generator.settings.author,
-                num_words_condition=num_words_condition,
-                sources=self.filtered_source_information(
-                    min_coverage_rating=self.book_generator.settings.min_coverage_rating,
-                    max_sources=self.book_generator.settings.max_sources))
-        llm = AsyncLLM(
+        def build_prompt(sources):
+            return i18n(
+                    prompt_key,
+                    title=self.book_generator.settings.title,
+                    author=self.book_generator.settings.author,
+                    num_words_condition=num_words_condition,
+                    sources=sources)
+
+        sources = self.filtered_source_information(
+                min_coverage_rating=self.book_generator.settings.min_coverage_rating,
+                max_sources=self.book_generator.settings.max_sources)
+        prompt = build_prompt(token_budget.fit_items(sources, token_budget.remaining_tokens(build_prompt([]))))
+        response = await execute_llm(
+                stage=prompt_key,
                 base=self.book_generator.settings.complex_base,
                 model=self.book_generator.settings.complex_model,
                 api_key=self.book_generator.settings.complex_api_key,
@@ -83,9 +90,7 @@ class TopicFinder(JSONCache):
                 max_output_tokens=50_000,
                 json_mode=True,
                 json_schema=json_schema)
-        await llm.execute()
-        llm.json_cache_save()
-        result = llm.response.get("topics", [])
+        result = response.get("topics", [])
         return result
 
     @Logger(override_function_name="Saving Topics to Google Doc")
@@ -98,7 +103,7 @@ class TopicFinder(JSONCache):
                 flat_row["sources"] = ", ".join([s.get("url") for s in flat_row["sources"]])
             flatted_topic_information.append(flat_row)
         tab.data = flatted_topic_information
-        tab.write_data(overwrite_tab=True)
+        sheet_writer.write(tab, overwrite_tab=True)
 
     async def run(self):
         self._load_source_summary_from_sheet()